@@ -0,0 +1,310 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import parse_pdf_source as pdf
+
+try:
+    import resource           # ru_maxrss, not on Windows
+except ImportError:
+    resource = None
+
+
+# benchmark suite for parse_pdf_source. generates synthetic PDFs for a few workload profiles, times the
+# tokenizer, the object parser and an end-to-end open (xref + every object + stream decode), records peak
+# python memory with tracemalloc and the peak resident set size of a child process running the stage (sees the
+# mapped file and C buffers tracemalloc doesn't), and writes everything to a JSON file so runs on different
+# commits compare. rss includes the interpreter, rss_base_bytes is the same process before the stage
+#
+#   python benchmark_pdf.py                               all profiles, 8MB each, results to bench.json
+#   python benchmark_pdf.py -p streams -p strings -s 32   selected profiles, 32MB files
+#   python benchmark_pdf.py -o new.json --compare old.json
+
+
+##############################################
+# synthetic PDF generator. every profile returns a list of object bodies (object number = index+1, object 1
+# is the catalog); buildPdf wraps them in a valid file with a classic xref table and trailer
+
+def pagesTree(first,n):
+    # catalog + pages node for n pages starting at object number first
+    kids = b' '.join(b'%d 0 R' % (first+k) for k in range(n))
+    return [b'<< /Type /Catalog /Pages 2 0 R >>',b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % n]
+
+def profileStreams(size,eol):
+    # stream heavy: flate compressed content streams of ~256KB each, most bytes are stream bodies.
+    # random coordinates (fixed seed) keep the compression ratio realistic and runs reproducible
+    chunk = 256*1024
+    rnd = random.Random(1)
+    lines = [b'%d %d m %d %d l %d.%d w S' % (rnd.randrange(612),rnd.randrange(792),rnd.randrange(612),rnd.randrange(792),
+                                              rnd.randrange(9),rnd.randrange(100)) for _ in range(chunk//6)]
+    content = b'q 1 0 0 1 0 0 cm' + eol + eol.join(lines) + eol + b'Q'
+    body = zlib.compress(content)
+    n = max(1,size//len(body))
+    objs = pagesTree(3,n)
+    for k in range(n):
+        objs.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R >>' % (3+n+k))
+    for k in range(n):
+        objs.append((b'<< /Length %d /Filter /FlateDecode >>' % len(body),body))
+    return objs
+
+def profileObjects(size,eol):
+    # many small objects: numbers, names, refs and short strings, ~100 bytes each
+    n = max(1,size//100)
+    objs = pagesTree(3,0)
+    for k in range(n):
+        objs.append(b'<< /Type /Annot /Subtype /Link /Rect [%d %d 612 792] /P %d 0 R /T (a%d) /F 4 >>' % (k,k%792,3+(k+1)%n,k))
+    return objs
+
+def profileNested(size,eol,depth=64):
+    # deeply nested dicts and arrays, one chain of `depth` levels per object
+    one = b''
+    for k in range(depth):
+        one = (b'<< /K %d /Kid ' % k if k%2 else b'[ %d 1.5 /N ' % k) + one
+    one += b'null'
+    for k in reversed(range(depth)):
+        one += b' >>' if k%2 else b' ]'
+    n = max(1,size//len(one))
+    return pagesTree(3,0) + [one]*n
+
+def profileStrings(size,eol):
+    # long literal strings with escapes and balanced parens, plus some hex strings
+    text = b'Lorem ipsum (dolor) sit amet, \\(escaped\\) consectetur \\\\ adipiscing \\n elit ' * 200
+    hexs = b'<' + text[:2048].hex().encode() + b'>'
+    one = b'<< /Contents (' + text + b') /Hex ' + hexs + b' >>'
+    n = max(1,size//len(one))
+    return pagesTree(3,0) + [one]*n
+
+def profileLines(size,eol):
+    # CR/LF heavy: every token on its own line, comments in between
+    one = eol.join([b'<<',b'/Type',b'/Thing',b'% a comment',b'/Values',b'[',b'1',b'2',b'3',b']',b'/Name',b'/X',b'>>'])
+    n = max(1,size//len(one))
+    return pagesTree(3,0) + [one]*n
+
+PROFILES = {
+    'streams':profileStreams,
+    'objects':profileObjects,
+    'nested':profileNested,
+    'strings':profileStrings,
+    'lines':profileLines,
+}
+
+def buildPdf(objs,eol=b'\n'):
+    # objs: bodies (bytes) or (dict bytes, stream data) pairs, numbered from 1
+    out = bytearray(b'%PDF-1.7' + eol + b'%\xe2\xe3\xcf\xd3' + eol)
+    offsets = []
+    for n,obj in enumerate(objs,1):
+        offsets.append(len(out))
+        out += b'%d 0 obj' % n + eol
+        if isinstance(obj,tuple):
+            out += obj[0] + eol + b'stream\r\n' + obj[1] + eol + b'endstream' + eol
+        else:
+            out += obj + eol
+        out += b'endobj' + eol
+    start = len(out)
+    out += b'xref' + eol + b'0 %d' % (len(objs)+1) + eol + b'0000000000 65535 f\r\n'
+    for offset in offsets:
+        out += b'%010d 00000 n\r\n' % offset
+    out += b'trailer' + eol + b'<< /Size %d /Root 1 0 R >>' % (len(objs)+1) + eol
+    out += b'startxref' + eol + b'%d' % start + eol + b'%%EOF' + eol
+    return bytes(out)
+
+def generate(profile,size,eol=b'\n',folder=None):
+    # write the profile's PDF (size in bytes, approximate) to folder, returns the path
+    path = os.path.join(folder or tempfile.gettempdir(),f'bench_{profile}_{size>>20}MB.pdf')
+    with open(path,'wb') as f:
+        f.write(buildPdf(PROFILES[profile](size,eol),eol))
+    return path
+
+
+##############################################
+# stages. each takes the file name and returns the number of items it processed
+
+def stageTokens(file,fast=True):
+    interp = pdf.PdfInterpreter(file,fast=fast,useMmap=True)
+    n = 0
+    while interp.nextToken():
+        n += 1
+    interp.close()
+    return n
+
+def stageObjects(file,fast=True):
+    interp = pdf.PdfInterpreter(file,fast=fast,useMmap=True)
+    n = 0
+    for _ in interp.iter_objects():
+        n += 1
+    interp.close()
+    return n
+
+def stageOpen(file,fast=True):
+    # end to end random access: load the xref, resolve every object, decode every stream
+    n = 0
+    with pdf.PdfInterpreter(file,fast=fast,useMmap=True) as interp:
+        interp.loadXref()
+        for objnum,gennum in sorted(interp.xref):
+            data = interp.get_object(objnum,gennum)
+            if data and len(data)==2 and isinstance(data[0],dict):
+                interp.streamData(objnum,gennum)
+            n += 1
+    return n
+
+def stageRetain(file,fast=True,compact=False):
+    # whole file parsed into interp.objects and kept: the peak memory of this stage is the object table
+    with pdf.PdfInterpreter(file,fast=fast,useMmap=True,compact=compact) as interp:
+        for _ in interp.iter_objects(retain=True):
+            pass
+        return len(interp.objects)
+
+def stageRetainCompact(file,fast=True):
+    # same with the compact value model (Ref tuples, StreamSpan bodies), compare its peak with 'objects'
+    return stageRetain(file,fast,compact=True)
+
+STAGES = {
+    'tokenize':stageTokens,
+    'parse':stageObjects,
+    'open':stageOpen,
+    'objects':stageRetain,
+    'objects-compact':stageRetainCompact,
+}
+
+def maxRss():
+    # peak resident set size of this process in bytes (ru_maxrss is KB on Linux, bytes on macOS)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss*1024
+
+def runChild(stage,file,fast):
+    # body of the measureRss child: (peak rss before, peak rss after) one run of the stage
+    before = maxRss()
+    STAGES[stage](file,fast)
+    return before,maxRss()
+
+def measureRss(stage,file,fast):
+    # (peak rss, peak rss before the stage) of a new process running the stage once, (None, None) without the
+    # resource module. a new process per stage, so an earlier stage's peak never hides a later one. started
+    # from the forkserver: Linux carries ru_maxrss over fork+exec, a child of this (by now big) process would
+    # start out at our peak. spawn where there is no forkserver
+    if resource is None:
+        return None,None
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(max_workers=1,mp_context=context) as pool:
+        before,after = pool.submit(runChild,stage,file,fast).result()
+    return after,before
+
+def measure(stage,file,repeat,fast):
+    # best and median wall time over `repeat` runs, then one extra run under tracemalloc for peak memory
+    # (tracemalloc slows everything down, so it is never part of the timed runs) and one in a child process
+    # for peak rss
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = STAGES[stage](file,fast)
+        times.append(time.perf_counter()-start)
+    tracemalloc.start()
+    STAGES[stage](file,fast)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss,rssBase = measureRss(stage,file,fast)
+    size = os.path.getsize(file)
+    return {
+        'items':items,
+        'bytes':size,
+        'best_s':min(times),
+        'median_s':statistics.median(times),
+        'mb_s':size/(1024*1024)/min(times),
+        'peak_bytes':peak,
+        'rss_bytes':rss,              # whole child process, interpreter and imports included
+        'rss_base_bytes':rssBase,     # the same child before the stage ran
+    }
+
+
+##############################################
+
+def gitCommit():
+    try:
+        return subprocess.run(['git','rev-parse','--short','HEAD'],capture_output=True,text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results,old):
+    # print throughput and peak memory against an older results file, >1.00x speed means faster now.
+    # throughput is per MB so runs with different --size still compare, peak memory only makes sense at equal size
+    before = {(r['profile'],r['stage'],r['tokenizer']):r for r in old['results']}
+    for r in results:
+        o = before.get((r['profile'],r['stage'],r['tokenizer']))
+        if o:
+            memory = f"{r['peak_bytes']/max(1,o['peak_bytes']):5.2f}x peak memory" if r['bytes']==o['bytes'] else 'different file size'
+            if r['bytes']==o['bytes'] and r.get('rss_bytes') and o.get('rss_bytes'):
+                memory += f", {r['rss_bytes']/o['rss_bytes']:5.2f}x peak rss"
+            print(f"{r['profile']:>8} {r['stage']:>8} {r['tokenizer']:>6}: {r['mb_s']/o['mb_s']:5.2f}x speed, {memory}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='parse_pdf_source benchmarks')
+    parser.add_argument('-p','--profile',action='append',choices=sorted(PROFILES),help='workload profile (repeatable, default all)')
+    parser.add_argument('-t','--stage',action='append',choices=list(STAGES),help='stage to time (repeatable, default all)')
+    parser.add_argument('-s','--size',type=float,default=8,help='generated file size in MB')
+    parser.add_argument('-r','--repeat',type=int,default=3,help='timed runs per stage')
+    parser.add_argument('--eol',choices=['lf','crlf','cr'],default='lf',help='line endings of generated files')
+    parser.add_argument('--legacy',action='store_true',help='also time the byte-at-a-time tokenizer (slow)')
+    parser.add_argument('--file',action='append',default=[],help='benchmark an existing PDF as well')
+    parser.add_argument('--keep',action='store_true',help='keep the generated files')
+    parser.add_argument('-o','--output',default='bench.json',help='results JSON file')
+    parser.add_argument('--compare',help='older results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    eol = {'lf':b'\n','crlf':b'\r\n','cr':b'\r'}[args.eol]
+    size = int(args.size*(1<<20))
+    tokenizers = [('fast',True)] + ([('legacy',False)] if args.legacy else [])
+    files = [(profile,generate(profile,size,eol),True) for profile in args.profile or sorted(PROFILES)]
+    files += [(os.path.basename(file),file,False) for file in args.file]
+
+    results = []
+    try:
+        for profile,file,generated in files:
+            for stage in args.stage or list(STAGES):
+                for name,fast in tokenizers:
+                    r = {'profile':profile,'stage':stage,'tokenizer':name}
+                    r.update(measure(stage,file,args.repeat,fast))
+                    results.append(r)
+                    rss = ''
+                    if r['rss_bytes'] is not None:
+                        rss = f"  rss {r['rss_bytes']/(1<<20):0.1f}MB (+{(r['rss_bytes']-r['rss_base_bytes'])/(1<<20):0.1f})"
+                    print(f"{profile:>8} {stage:>8} {name:>6}: {r['mb_s']:8.2f}MB/s  best {r['best_s']:0.3f}s"
+                          f"  peak {r['peak_bytes']/(1<<20):0.1f}MB{rss}  ({r['items']} items)")
+    finally:
+        if not args.keep:
+            for _,file,generated in files:
+                if generated:
+                    os.remove(file)
+
+    out = {
+        'commit':gitCommit(),
+        'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':sys.version.split()[0],
+        'platform':platform.platform(),
+        'size_mb':args.size,
+        'eol':args.eol,
+        'repeat':args.repeat,
+        'results':results,
+    }
+    with open(args.output,'w') as f:
+        json.dump(out,f,indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results,json.load(f))
+    return out
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,128 @@
 # -*- coding: utf-8 -*-
 """
 parses PDF as text file.
-uncompress pdf with pdftk first: pdftk in.pdf output out.pdf uncompress. 
-otherwise will not be plain text
+cross-reference streams and object streams (PDF 1.5+) are read directly through the xref,
+no need to uncompress with pdftk first. get_object() looks objects up inside object streams.
 
 parser implemented based on ISO 32000-2:2020(E) (PDF2.0)
 
 @author: noursec
 """
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
 import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 # from collections import namedtuple
 
+# token type codes. small ints instead of strings: cheaper to store and compare, TOKEN_NAMES[code] for printing
+TOKEN_NAMES = ('NONE','NUM_INT','NUM_REAL','NAME','STR_LIT','STR_HEX','COMMENT','DICT_BEGIN','DICT_END','ARR_BEGIN','ARR_END',
+               'FN_BEGIN','FN_END','OBJ_BEGIN','OBJ_END','OBJ_REF','STREAM','NULL','BOOL','XREF_BEGIN','XREF_INUSE','XREF_FREE',
+               'TRAILER','XREF_LOC','DELIM','REG','CHAR_WS','CHAR_EOL')
+(NONE,NUM_INT,NUM_REAL,NAME,STR_LIT,STR_HEX,COMMENT,DICT_BEGIN,DICT_END,ARR_BEGIN,ARR_END,
+ FN_BEGIN,FN_END,OBJ_BEGIN,OBJ_END,OBJ_REF,STREAM,NULL,BOOL,XREF_BEGIN,XREF_INUSE,XREF_FREE,
+ TRAILER,XREF_LOC,DELIM,REG,CHAR_WS,CHAR_EOL) = range(len(TOKEN_NAMES))
+
+VALUE_TOKENS = frozenset([NUM_REAL,NUM_INT,STR_LIT,STR_HEX,BOOL,NAME,STREAM,NULL])   # tokens that are a complete value
+
 # Token = namedtuple('Token', ['type','value','pos'])
 class Token:
+    __slots__ = ('type','data','pos')     # no per-token __dict__
     def __init__(self,token_type,data,pos):
         self.type = token_type
         self.data = data
         self.pos = pos
     def __repr__(self):
-        return f'Token<{self.type}><{self.data}><{self.pos}>'
+        return f'Token<{TOKEN_NAMES[self.type]}><{self.data}><{self.pos}>'
     def __str__(self):
-        return f'Token<{self.type}>'
+        return f'Token<{TOKEN_NAMES[self.type]}>'
     def __eq__(self, o):
         return self.type == o.type
     def __contains__(self,o):
         return self.data.__contains__(o)
     
         
+class TokenBuffer:
+    # struct-of-arrays token log: type code, offset and length in typed arrays, 17 bytes per token instead of
+    # a Token object plus its data. with maxlen it is a ring buffer that keeps only the last maxlen tokens
+    def __init__(self,maxlen=None):
+        self.maxlen = maxlen
+        self.count = 0      # tokens appended in total
+        if maxlen:
+            self.types = array('B',bytes(maxlen))
+            self.offsets = array('q',[0])*maxlen
+            self.lengths = array('q',[0])*maxlen
+        else:
+            self.types = array('B')
+            self.offsets = array('q')
+            self.lengths = array('q')
+            
+    def append(self,token_type,offset,length):
+        if self.maxlen:
+            k = self.count % self.maxlen
+            self.types[k] = token_type
+            self.offsets[k] = offset
+            self.lengths[k] = length
+        else:
+            self.types.append(token_type)
+            self.offsets.append(offset)
+            self.lengths.append(length)
+        self.count += 1
+        
+    def __len__(self):
+        return min(self.count,self.maxlen) if self.maxlen else self.count
+    
+    def __getitem__(self,i):
+        # (type, offset, length) of the i-th retained token, oldest first. negative i counts from the newest
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('token index out of range')
+        if self.maxlen:
+            i = (self.count-n+i) % self.maxlen
+        return self.types[i],self.offsets[i],self.lengths[i]
+    
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+    
+    
+class ParseStats:
+    # counters filled by an instrumented PdfInterpreter(stats=True), see nextTokenCounted. tokens and bytes per
+    # token type code, time spent inside the tokenizer. the rest of the wall time between the first and the
+    # last token is object assembly (nextObject/readObjectData/iter_objects and whatever the caller does)
+    def __init__(self):
+        self.tokens = [0]*len(TOKEN_NAMES)
+        self.tokenBytes = [0]*len(TOKEN_NAMES)   # from token start to the tokenizer position after it, STREAM includes the body
+        self.tokenTime = 0.0
+        self.first = None     # perf_counter at the first and after the last token
+        self.last = None
+        
+    def report(self):
+        # plain dict for printing/json, token types that never showed up are left out
+        elapsed = self.last-self.first if self.first is not None else 0.0
+        return {
+            'tokens':{TOKEN_NAMES[t]:n for t,n in enumerate(self.tokens) if n},
+            'bytes':{TOKEN_NAMES[t]:n for t,n in enumerate(self.tokenBytes) if n},
+            'elapsed_s':elapsed,
+            'tokenizer_s':self.tokenTime,
+            'assembly_s':max(0.0,elapsed-self.tokenTime),
+        }
+
+
 def readBytes(file, chunk=16384):
     # generator to iterate over raw bytes of input file
     # experiment with different methods for speedup eg just copy whole pdf into RAM at once
@@ -36,6 +132,845 @@ def readBytes(file, chunk=16384):
         # while fchunk := f.read(chunk):
         #     yield from fchunk
 
+def mapBytes(file):
+    # read-only memory map of the input file. pages are loaded by the OS on first touch,
+    # so resident memory stays near what the parser actually reads instead of the whole file
+    with open(file,'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)   # mapping stays valid after f is closed
+
+##############################################
+# compiled patterns for the bulk scanner (PdfInterpreter.nextTokenFast). same char classes as PdfInterpreter.CHAR_*
+
+# one match per token: skip leading whitespace, then a numeric run (1), a name (2), the R of a reference (3),
+# << (4), >> (5), [ (6), ] (7), another keyword/regular run (8) or any other single delimiter (9).
+# m.lastindex picks the branch, so whitespace costs nothing extra and the common tokens need no second look
+RE_TOKEN = re.compile(rb'[\x00\t\n\x0c\r ]*(?:([0-9+\-.]+)|/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)|(R)(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])'
+                      rb'|(<<)|(>>)|(\[)|(\])|([^\x00\t\n\x0c\r ()<>\[\]{}/%]+)|(.))', re.S)
+RE_XREF_BODY = re.compile(rb'[\x00\t\n\x0c\r 0-9nf]*trailer')   # rest of a classic xref table, up to its trailer
+RE_EOL = re.compile(rb'[\r\n]')     # end of comment
+RE_STR = re.compile(rb'[()\\]')     # chars that matter inside a literal string
+RE_ENDSTREAM = re.compile(rb'[\x00\t\n\x0c\r ]*endstream')   # what must follow stream data of the right /Length
+RE_OBJ_HEADER = re.compile(rb'(?<![0-9])(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj\b')   # 'N G obj'
+RE_OBJ_TAIL = re.compile(rb'(?<![0-9])(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj\Z')  # 'N G' in front of a found 'obj'
+RE_OBJ_AT = re.compile(rb'[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj\b')  # header at an xref offset
+RE_STREAM_LENGTH = re.compile(rb'/Length[\x00\t\n\x0c\r ]*(\d+)(?![0-9]|[\x00\t\n\x0c\r ]+\d+[\x00\t\n\x0c\r ]+R)')  # direct /Length in a stream dict
+RE_RECOVER_TYPE = re.compile(rb'/Type[\x00\t\n\x0c\r ]*/(XRef|ObjStm|Catalog)(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')  # objects recovery reads
+RE_XREF_ENTRY = re.compile(rb'(\d+) +(\d+) +([nf])')   # classic xref table entry 'oooooooooo ggggg n'. nominally 20 bytes
+XREF_SAMPLES = 32      # xref entries loadXref checks against their object headers (xrefIntact)
+
+def literalEnd(data,j,end):
+    # offset behind the ')' closing the literal string whose body starts at j, end+1 when it is unterminated.
+    # jumps between parens/escapes only
+    n = 1
+    while n>0:
+        m = RE_STR.search(data,j,end)
+        if m is None:
+            return end+1
+        j = m.end()
+        p = data[j-1]
+        if p==92:                    # b'\\' skip escaped char
+            j += 1
+        elif p==40:
+            n += 1
+        else:
+            n -= 1
+    return j
+
+class Name(bytes):
+    # /Name token data. a bytes subclass, so lookups like d[b'Type'] still work, but the writer can tell names
+    # from literal strings (both raw bytes from the file, without the '/' or the parens)
+    __slots__ = ()
+    def __reduce__(self):            # unpickle (parseParallel results) onto the shared Name of this process
+        return internName,(bytes(self),)
+
+class HexString(bytes):
+    # <hex string> token data, the raw hex digits between < and >
+    __slots__ = ()
+
+NAMES = {}              # interned Name objects, see internName
+NAMES_MAX = 1<<16       # past this many, new names are not interned (files with generated names can't grow it forever)
+
+def internName(raw):
+    # the shared Name for raw bytes, so the /Type, /Length etc. keys of all objects are one object each
+    name = NAMES.get(raw)
+    if name is None:
+        name = Name(raw)
+        if len(NAMES) < NAMES_MAX:
+            NAMES[name] = name
+    return name
+
+REFS = {}               # interned Ref objects, see internRef
+REFS_MAX = 1<<14        # bounded like NAMES: the first refs of a file are the shared ones (/Parent, fonts, resources)
+
+def internRef(objnum,gennum=0):
+    # the shared Ref for 'objNum genNum R', the compact newRef and the unpickling of Ref values
+    key = (objnum,gennum)
+    ref = REFS.get(key)
+    if ref is None:
+        ref = Ref(objnum,gennum)
+        if len(REFS) < REFS_MAX:
+            REFS[ref] = ref
+    return ref
+
+class Ref(tuple):
+    # compact indirect reference 'N G R', PdfInterpreter(compact=True) makes these instead of the
+    # {(objNum, genNum): 'REF'} dicts. a tuple subclass without __dict__: 56 bytes instead of a dict plus a key
+    # tuple, and it hashes/compares like the plain (objNum, genNum) key, so self.objects[ref] works directly
+    __slots__ = ()
+    def __new__(cls,objnum,gennum=0):
+        return tuple.__new__(cls,(objnum,gennum))
+    def __reduce__(self):            # unpickle (parseParallel results) onto the shared Ref of this process
+        return internRef,tuple(self)
+    def __repr__(self):
+        return f'Ref<{self[0]} {self[1]} R>'
+
+class StreamSpan:
+    # location of a stream body in the input. stands in for the stream data with PdfInterpreter(streamBodies=False)
+    # so scans that only need metadata never touch the payload. PdfInterpreter.streamBytes() reads it
+    __slots__ = ('offset','length')
+    def __init__(self,offset,length):
+        self.offset = offset
+        self.length = length
+    def __repr__(self):
+        return f'StreamSpan<{self.offset}><{self.length}>'
+    def __len__(self):
+        return self.length
+    def __eq__(self,o):
+        return isinstance(o,StreamSpan) and self.offset == o.offset and self.length == o.length
+    def __hash__(self):
+        return hash((self.offset,self.length))
+
+class ObjectRef:
+    # lazy indirect reference for the document model (PdfInterpreter.lazyValue/page_count/get_page). the
+    # referenced object is loaded through the interpreter (object table, cache, or random access via the xref)
+    # the first time .value is used, and its own references become ObjectRefs in turn, so only what is touched
+    # gets parsed. one proxy per (objNum, genNum) per interpreter, cycles just point back at the same proxy
+    __slots__ = ('doc','key','loaded','_value')
+    def __init__(self,doc,objnum,gennum):
+        self.doc = doc
+        self.key = (objnum,gennum)
+        self.loaded = False
+        self._value = None
+    @property
+    def value(self):
+        # the referenced value (dict for streams, see stream()). None for objects missing from the file
+        if not self.loaded:
+            self._value = self.doc.lazyObject(*self.key)
+            self.loaded = True
+        return self._value
+    def reset(self):
+        # forget the loaded value, next access loads it again (after setObject)
+        self.loaded = False
+        self._value = None
+    def stream(self):
+        # decoded stream data of the referenced object, None if it is not a stream
+        return self.doc.streamData(*self.key)
+    def __repr__(self):
+        return f'ObjectRef<{self.key[0]} {self.key[1]} R>'
+    def __eq__(self,o):
+        return isinstance(o,ObjectRef) and self.key == o.key and self.doc is o.doc
+    def __hash__(self):
+        return hash(self.key)
+    # container access goes to the referenced value, so ref[b'Kids'][0][b'Type'] works without .value
+    def __getitem__(self,k):
+        return self.value[k]
+    def get(self,k,default=None):
+        value = self.value
+        return value.get(k,default) if isinstance(value,dict) else default
+    def __contains__(self,k):
+        value = self.value
+        return isinstance(value,(dict,list)) and k in value
+    def __iter__(self):
+        return iter(self.value)
+    def __len__(self):
+        return len(self.value)
+
+KEYWORD_TOKENS = {b'R':OBJ_REF, b'n':XREF_INUSE, b'obj':OBJ_BEGIN, b'endobj':OBJ_END,
+                  b'null':NULL, b'false':BOOL, b'true':BOOL, b'xref':XREF_BEGIN,
+                  b'f':XREF_FREE, b'trailer':TRAILER, b'startxref':XREF_LOC}
+
+
+##############################################
+# stream filters (7.4). every filter is a generator that takes an iterator of encoded chunks and yields
+# decoded chunks, so a chain is just nested generators and nothing has to hold the whole stream.
+# decodeStream() is the one-shot version, iterDecode() the incremental one
+
+DECODE_CHUNK = 1<<16     # max size of chunks fed into/out of the filter generators
+CHAR_WS_BYTES = b'\x00\t\n\x0c\r '
+
+def iterChunks(data,chunk=DECODE_CHUNK):
+    # split a buffer into chunks. memoryview slices, so nothing is copied
+    view = memoryview(data)
+    for p in range(0,len(view),chunk):
+        yield view[p:p+chunk]
+
+def flateChunks(chunks,parms):
+    d = zlib.decompressobj()
+    try:
+        for c in chunks:
+            while c:
+                out = d.decompress(c,DECODE_CHUNK)   # bounded output per call, rest waits in unconsumed_tail
+                if out:
+                    yield out
+                c = d.unconsumed_tail
+        out = d.flush()
+        if out:
+            yield out
+    except zlib.error as e:          # truncated/corrupt data, keep what was decoded so far like most readers do
+        print(f'FlateDecode error: {e}')
+
+def lzwChunks(chunks,parms):
+    # variable width (9-12 bit) LZW, 7.4.4.2. /EarlyChange 1 (default) widens the code one entry early.
+    # a code past the table ends the stream, keeping what was decoded so far like flateChunks
+    early = parms.get(b'EarlyChange',1)
+    table = [bytes([i]) for i in range(256)] + [b'',b'']   # 256 = clear table, 257 = EOD
+    width = 9
+    prev = None
+    buf = nbits = 0
+    for c in chunks:
+        out = bytearray()
+        for byte in c:
+            buf = (buf<<8) | byte
+            nbits += 8
+            while nbits >= width:
+                nbits -= width
+                code = buf >> nbits
+                buf &= (1<<nbits)-1
+                if code == 256:
+                    del table[258:]
+                    width = 9
+                    prev = None
+                    continue
+                if code == 257:
+                    yield bytes(out)
+                    return
+                if code > len(table) or code == len(table) and prev is None:
+                    print(f'LZWDecode error: code {code} not in table')
+                    yield bytes(out)
+                    return
+                if prev is None:
+                    entry = table[code]
+                else:
+                    entry = table[code] if code < len(table) else prev + prev[:1]
+                    table.append(prev + entry[:1])
+                    if len(table)+early >= 1<<width and width < 12:
+                        width += 1
+                out += entry
+                prev = entry
+        yield bytes(out)
+
+def asciiHexChunks(chunks,parms):
+    # pairs of hex digits, whitespace ignored, '>' is EOD. odd final digit counts as followed by 0
+    carry = b''
+    try:
+        for c in chunks:
+            c = carry + bytes(c).translate(None,CHAR_WS_BYTES)
+            eod = c.find(b'>')
+            if eod >= 0:
+                c = c[:eod]
+                if len(c) % 2:
+                    c += b'0'
+                yield bytes.fromhex(c.decode('latin-1'))
+                return
+            cut = len(c) - len(c) % 2
+            carry = c[cut:]
+            yield bytes.fromhex(c[:cut].decode('latin-1'))
+        if carry:
+            yield bytes.fromhex((carry+b'0').decode('latin-1'))
+    except ValueError as e:          # not a hex digit. the chunks before it are already out
+        print(f'ASCIIHexDecode error: {e}')
+
+def ascii85Chunks(chunks,parms):
+    # base-85 groups of 5 chars -> 4 bytes, 'z' = 4 zero bytes, '~>' is EOD
+    carry = b''
+    try:
+        for c in chunks:
+            c = carry + bytes(c).translate(None,CHAR_WS_BYTES).replace(b'z',b'!!!!!')
+            eod = c.find(b'~')
+            if eod >= 0:
+                yield base64.a85decode(c[:eod])     # a85decode pads the last partial group itself
+                return
+            cut = len(c) - len(c) % 5
+            carry = c[cut:]
+            yield base64.a85decode(c[:cut])
+        if carry:
+            yield base64.a85decode(carry)
+    except ValueError as e:          # char outside !..u or a group over 2^32, keep the chunks before it
+        print(f'ASCII85Decode error: {e}')
+
+def runLengthChunks(chunks,parms):
+    # length byte n: 0-127 copy next n+1 bytes, 129-255 repeat next byte 257-n times, 128 is EOD
+    carry = b''
+    for c in chunks:
+        c = carry + bytes(c)
+        out = bytearray()
+        p,end = 0,len(c)
+        while p < end:
+            n = c[p]
+            if n == 128:
+                yield bytes(out)
+                return
+            if n < 128:
+                if p+n+2 > end:
+                    break
+                out += c[p+1:p+n+2]
+                p += n+2
+            else:
+                if p+2 > end:
+                    break
+                out += c[p+1:p+2] * (257-n)
+                p += 2
+        carry = c[p:]
+        yield bytes(out)
+
+def predictorChunks(chunks,parms):
+    # undo PNG (/Predictor >= 10, rows prefixed with a filter type byte) or TIFF 2 predictors, row by row (7.4.4.4)
+    predictor = parms.get(b'Predictor',1)
+    if predictor == 1:
+        yield from chunks
+        return
+    colors,bpc,columns = parms.get(b'Colors',1),parms.get(b'BitsPerComponent',8),parms.get(b'Columns',1)
+    if not all(type(n) is int and n > 0 for n in (colors,bpc,columns)):
+        print(f'bad predictor parameters /Colors {colors} /BitsPerComponent {bpc} /Columns {columns}')
+        yield from chunks
+        return
+    bpp = max(1,colors*bpc//8)             # bytes per pixel, the 'left' neighbour distance
+    rowlen = (columns*colors*bpc+7)//8
+    if predictor == 2 and bpc != 8:
+        print(f'TIFF predictor with {bpc} bits per component not supported')
+        yield from chunks
+        return
+    stride = rowlen + (predictor >= 10)
+    prev = bytearray(rowlen)
+    carry = b''
+    for c in chunks:
+        c = carry + bytes(c)
+        out = bytearray()
+        p = 0
+        while p+stride <= len(c):
+            if predictor == 2:
+                row = bytearray(c[p:p+rowlen])
+                for k in range(bpp,rowlen):
+                    row[k] = (row[k]+row[k-bpp]) & 255
+            else:
+                row = unpredictRow(c[p],bytearray(c[p+1:p+stride]),prev,bpp)
+            out += row
+            prev = row
+            p += stride
+        carry = c[p:]
+        yield bytes(out)
+
+def unpredictRow(ftype,row,prev,bpp):
+    # one PNG predictor row, in place
+    rowlen = len(row)
+    if ftype == 1:    # Sub
+        for k in range(bpp,rowlen):
+            row[k] = (row[k]+row[k-bpp]) & 255
+    elif ftype == 2:  # Up
+        row = bytearray([(a+b) & 255 for a,b in zip(row,prev)])
+    elif ftype == 3:  # Average
+        for k in range(rowlen):
+            left = row[k-bpp] if k>=bpp else 0
+            row[k] = (row[k]+((left+prev[k])>>1)) & 255
+    elif ftype == 4:  # Paeth
+        for k in range(rowlen):
+            a = row[k-bpp] if k>=bpp else 0
+            b = prev[k]
+            c = prev[k-bpp] if k>=bpp else 0
+            pa,pb,pc = abs(b-c),abs(a-c),abs(a+b-2*c)
+            row[k] = (row[k]+(a if pa<=pb and pa<=pc else b if pb<=pc else c)) & 255
+    return row
+
+# filter name (and abbreviation used in inline images) -> chunk generator, and whether /DecodeParms predictors apply
+FILTERS = {b'FlateDecode':(flateChunks,True), b'Fl':(flateChunks,True),
+           b'LZWDecode':(lzwChunks,True), b'LZW':(lzwChunks,True),
+           b'ASCIIHexDecode':(asciiHexChunks,False), b'AHx':(asciiHexChunks,False),
+           b'ASCII85Decode':(ascii85Chunks,False), b'A85':(ascii85Chunks,False),
+           b'RunLengthDecode':(runLengthChunks,False), b'RL':(runLengthChunks,False)}
+
+def streamFilters(streamDict):
+    # [(filter name, parms dict), ...] in decode order, None if any filter in the chain is not supported.
+    # image-only filters (DCT, JPX, CCITT, JBIG2) are left to the caller
+    filters = streamDict.get(b'Filter',[])
+    parms = streamDict.get(b'DecodeParms',[])
+    if not isinstance(filters,list):
+        filters,parms = [filters],[parms]
+    if not isinstance(parms,list):
+        parms = [parms]
+    chain = [(f,p or {}) for f,p in zip(filters,parms+[None]*(len(filters)-len(parms)))]
+    for f,_ in chain:
+        if f not in FILTERS:
+            print(f'unsupported filter {f}')
+            return None
+    return chain
+
+def iterDecode(streamDict,data,chunk=DECODE_CHUNK):
+    # decoded stream data as a generator of chunks, for streams too big to hold decoded in memory
+    chain = streamFilters(streamDict)
+    if chain is None:
+        return
+    chunks = iterChunks(data,chunk)
+    for f,p in chain:
+        decoder,predicts = FILTERS[f]
+        chunks = decoder(chunks,p)
+        if predicts and p.get(b'Predictor',1) > 1:
+            chunks = predictorChunks(chunks,p)
+    yield from chunks
+
+def decodeStream(streamDict,data):
+    # decoded stream data according to /Filter and /DecodeParms. None if a filter is not supported
+    if streamFilters(streamDict) is None:
+        return None
+    return b''.join(iterDecode(streamDict,data,max(len(data),1)))   # one chunk, each filter runs once over all of it
+
+
+class DecodeCache():
+    # LRU of decoded stream data, bounded by total bytes instead of entry count
+    def __init__(self,budget):
+        self.budget = budget
+        self.size = 0
+        self.entries = OrderedDict()
+        
+    def get(self,key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+        return data
+    
+    def put(self,key,data):
+        if len(data) > self.budget:     # would evict everything else, not worth it
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.budget:
+            self.size -= len(self.entries.popitem(last=False)[1])
+    
+    def pop(self,key):
+        data = self.entries.pop(key,None)
+        if data is not None:
+            self.size -= len(data)
+        return data
+    
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+##############################################
+# content streams (7.8.2). page content is a flat run of operands followed by an operator, no indirect objects
+# or streams, so it gets its own lexer instead of nextToken (which prints 'unhandled keyword' for every Tj).
+# one regex match per token over the decoded buffer, literal strings jump between parens like nextTokenFast,
+# inline images (BI ... ID data EI, 8.9.7) are cut out in one piece
+
+RE_CONTENT_TOKEN = re.compile(rb'[\x00\t\n\x0c\r ]*(?:([0-9+\-.]+)|/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)|([^\x00\t\n\x0c\r ()<>\[\]{}/%]+)|(<<|>>|.))', re.S)
+RE_INLINE_END = re.compile(rb'[\x00\t\n\x0c\r ]EI(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')   # whitespace, EI, delimiter or end
+RE_STRING_ESCAPE = re.compile(rb'\\([0-7]{1,3}|\r\n|[\s\S])')
+TEXT_OPERATORS = frozenset([b'Tj',b"'",b'"',b'TJ',b'Tf',b'Td',b'TD',b'T*',b'ET',b'Tm',b'Do'])   # what contentText looks at
+CONTENT_CONSTANTS = {b'true':True,b'false':False,b'null':None}
+STRING_ESCAPES = {110:b'\n',114:b'\r',116:b'\t',98:b'\b',102:b'\f'}   # \n \r \t \b \f, anything else is the char itself
+
+def iterContent(data):
+    # generator of (operands, operator) tuples for decoded content stream data (or a ToUnicode CMap, same syntax).
+    # operands are values like the object parser makes them (int/float, Name, raw literal string bytes, HexString,
+    # lists, dicts), the operator is bytes. inline images come out as ([parameter dict, image data], b'BI')
+    operands = []
+    frames = []          # operands of the enclosing levels while inside [ ] or << >>
+    image = None         # operands before BI, while reading the inline image dictionary
+    end = len(data)
+    match = RE_CONTENT_TOKEN.match
+    j = 0
+    while True:
+        m = match(data,j)
+        if m is None:
+            break
+        group = m.lastindex
+        j = m.end()
+        if group == 1:    # numeric
+            num = m.group(1)
+            try:
+                value = float(num) if 46 in num else int(num)
+            except ValueError:           # '-', '1.2.3' etc. readers take these as 0
+                value = 0
+        elif group == 2:  # /name
+            value = internName(m.group(2))
+        elif group == 3:  # operator, or true/false/null
+            keyword = m.group(3)
+            if keyword in CONTENT_CONSTANTS:
+                value = CONTENT_CONSTANTS[keyword]
+            elif keyword == b'BI':
+                image = operands
+                operands = []
+                continue
+            elif keyword == b'ID' and image is not None:
+                params = dict(zip(operands[::2],operands[1::2]))
+                start = j+1                  # single whitespace after ID
+                length = params.get(b'L',params.get(b'Length'))    # PDF 2.0 gives the length, older files don't
+                e = None
+                if isinstance(length,int) and length >= 0:
+                    e = RE_INLINE_END.match(data,start+length) or RE_INLINE_END.match(data,start+length-1)
+                if e is None:
+                    e = RE_INLINE_END.search(data,start)
+                stop = e.start() if e else end
+                j = e.end() if e else end
+                yield [params,data[start:stop]],b'BI'
+                operands,image = image,None
+                continue
+            else:
+                if frames:               # operator inside an unclosed [ or <<, drop the broken operands
+                    operands = frames[0]
+                    frames.clear()
+                yield operands,keyword
+                operands = []
+                continue
+        else:             # delimiter
+            d = m.group(4)
+            b = d[0]
+            if b == 91 or d == b'<<':    # '[' '<<'
+                frames.append(operands)
+                operands = []
+                continue
+            elif b == 93:  # ']'
+                value = operands
+                operands = frames.pop() if frames else []
+            elif d == b'>>':
+                value = dict(zip(operands[::2],operands[1::2]))
+                operands = frames.pop() if frames else []
+            elif b == 40:  # '('
+                n = 1
+                k = j
+                while n > 0:
+                    e = RE_STR.search(data,k)
+                    if e is None:
+                        k = end+1
+                        break
+                    k = e.end()
+                    p = data[k-1]
+                    if p == 92:
+                        k += 1
+                    elif p == 40:
+                        n += 1
+                    else:
+                        n -= 1
+                value = data[j:k-1]
+                j = min(k,end)
+            elif b == 60:  # '<' hex string
+                k = data.find(b'>',j)
+                if k < 0:
+                    k = end
+                value = HexString(data[j:k])
+                j = min(k+1,end)
+            elif b == 37:  # '%' comment
+                e = RE_EOL.search(data,j)
+                j = e.start() if e else end
+                continue
+            elif b in CHAR_WS_BYTES:   # only trailing whitespace left
+                break
+            else:          # stray ')' '>' '{' '}'
+                continue
+        operands.append(value)
+
+def unescapeString(raw):
+    # literal string token data (escapes as in the file) to the bytes of the string (7.3.4.2)
+    raw = bytes(raw)
+    if 92 not in raw:
+        return raw
+    def unescape(m):
+        s = m.group(1)
+        if 48 <= s[0] <= 55:     # \ddd octal
+            return bytes((int(s,8) & 255,))
+        if s[0] in (10,13):      # backslash at end of line: line continuation
+            return b''
+        return STRING_ESCAPES.get(s[0],s)
+    return RE_STRING_ESCAPE.sub(unescape,raw)
+
+def hexBytes(hexString):
+    # bytes of a <hex string>, whitespace ignored, odd digit count padded with 0 (7.3.4.3)
+    digits = bytes(hexString).translate(None,CHAR_WS_BYTES)
+    if len(digits) % 2:
+        digits += b'0'
+    try:
+        return bytes.fromhex(digits.decode('ascii'))
+    except ValueError:
+        return b''
+
+def stringBytes(value):
+    # bytes of a string operand, either kind
+    if isinstance(value,HexString):
+        return hexBytes(value)
+    return unescapeString(value)
+
+RE_STRING_SPECIAL = re.compile(rb'[()\\\r]')     # chars escapeString puts a backslash in front of (\r as \\r)
+
+def escapeString(text):
+    # literal string body for new text: the inverse of unescapeString. strings in the object model are the raw
+    # token data (escapes as in the file) and serializeValue writes them between parens unchanged, so text for
+    # setObject/addObject has to go through here, [escapeString(b'a)b')] writes (a\)b). str is written as
+    # latin-1 when it fits, otherwise UTF-16BE with a byte order mark (7.9.2.2)
+    if isinstance(text,str):
+        try:
+            text = text.encode('latin-1')
+        except UnicodeEncodeError:
+            text = b'\xfe\xff' + text.encode('utf-16-be')
+    return RE_STRING_SPECIAL.sub(lambda m: b'\\r' if m[0] == b'\r' else b'\\' + m[0],bytes(text))
+
+def parseToUnicode(data):
+    # ToUnicode CMap (9.10.3) to ({code bytes: text}, code widths longest first). CMaps are PostScript, but
+    # bfchar/bfrange sections lex fine with iterContent: the pairs/triples are the operands of 'endbf...'
+    cmap = {}
+    widths = set()
+    for operands,op in iterContent(data):
+        if op == b'endcodespacerange':
+            widths.update(len(hexBytes(h)) for h in operands if isinstance(h,HexString))
+        elif op == b'endbfchar':
+            for src,dst in zip(operands[::2],operands[1::2]):
+                if isinstance(src,HexString) and isinstance(dst,HexString):
+                    code = hexBytes(src)
+                    cmap[code] = hexBytes(dst).decode('utf-16-be','replace')
+                    widths.add(len(code))
+        elif op == b'endbfrange':
+            for lo,hi,dst in zip(operands[::3],operands[1::3],operands[2::3]):
+                lo,hi = hexBytes(lo),hexBytes(hi)
+                width = len(lo)
+                first,last = int.from_bytes(lo,'big'),int.from_bytes(hi,'big')
+                if last-first > 0xffff:          # garbage, don't build a giant map
+                    continue
+                widths.add(width)
+                if isinstance(dst,list):         # one destination per code
+                    for code,d in zip(range(first,last+1),dst):
+                        if isinstance(d,HexString):
+                            cmap[code.to_bytes(width,'big')] = hexBytes(d).decode('utf-16-be','replace')
+                elif isinstance(dst,HexString):  # destination counts up with the code (last byte)
+                    base = hexBytes(dst)
+                    start = int.from_bytes(base,'big')
+                    for k in range(last-first+1):
+                        text = (start+k).to_bytes(len(base),'big').decode('utf-16-be','replace')
+                        cmap[(first+k).to_bytes(width,'big')] = text
+    return cmap,sorted(widths or {1},reverse=True)
+
+def latin1(s):
+    # default text decoder for simple fonts without a ToUnicode map
+    return s.decode('latin-1')
+
+def cidDecoder(encoding):
+    # text decoder for Type0 font codes the ToUnicode map doesn't cover (or all of them, without one). with
+    # Identity-H/V and most predefined CMaps the codes are CIDs, glyph selectors rather than text, so they come
+    # out as one U+FFFD per two byte code. the Uni...-UCS2/UTF16 CMaps take UTF-16BE codes, those decode directly
+    if isinstance(encoding,bytes) and encoding.startswith(b'Uni') and (b'-UCS2-' in encoding or b'-UTF16-' in encoding):
+        return lambda s: s.decode('utf-16-be','replace')
+    return lambda s: '\ufffd'*((len(s)+1)//2)
+
+def cmapDecoder(cmap,widths,fallback=latin1):
+    # text decoder for font codes through a ToUnicode map. codes the map doesn't cover go through fallback, the
+    # decoder of the font's own encoding (9.10.2): pdfTeX writes maps with only the ligatures in them
+    if widths == [1]:          # one byte codes (simple fonts): latin-1 puts every code on one char, str.translate
+        table = {}             # maps them all in C
+        for c in range(256):
+            code = bytes((c,))
+            text = cmap.get(code)
+            table[c] = fallback(code) if text is None else text
+        return lambda s: s.decode('latin-1').translate(table)
+    get = cmap.get
+    def lookup(code):
+        text = get(code)
+        return fallback(code) if text is None else text
+    if len(widths) == 1:
+        w = widths[0]
+        return lambda s: ''.join([lookup(s[k:k+w]) for k in range(0,len(s),w)])
+    def decode(s):
+        out = []
+        k = 0
+        while k < len(s):
+            for w in widths:
+                text = get(s[k:k+w])
+                if text is not None:
+                    break
+            else:
+                w = widths[-1]
+                text = fallback(s[k:k+w])
+            out.append(text)
+            k += w
+        return ''.join(out)
+    return decode
+
+
+##############################################
+# writer. turns the object model (see PdfInterpreter.objects) back into PDF syntax
+
+RE_NAME_ESCAPE = re.compile(rb'[\x00-\x20\x7f-\xff()<>\[\]{}/%]')   # chars that need #xx in a written name
+SHAREABLE_TYPES = {b'Font',b'FontDescriptor',b'Encoding',b'XObject',b'ExtGState',b'Pattern',b'Shading',b'Halftone',b'CMap'}
+COLOR_SPACE_FAMILIES = {b'ICCBased',b'Indexed',b'Separation',b'DeviceN',b'CalRGB',b'CalGray',b'Lab',b'Pattern'}
+XREF_ONLY_KEYS = {b'Prev',b'XRefStm',b'Type',b'W',b'Index',b'Filter',b'DecodeParms',b'Length'}  # trailer keys that describe the old xref
+
+def isRef(value):
+    # True for indirect references: Ref, or the {(objNum, genNum): 'REF'} placeholders of the default value model
+    if isinstance(value,Ref):
+        return True
+    if isinstance(value,dict) and len(value)==1:
+        (key,tag), = value.items()
+        return tag == 'REF' and isinstance(key,tuple)
+    return False
+
+def refKey(value):
+    # (objNum, genNum) of a reference in either form, None for anything else
+    if isinstance(value,Ref):
+        return value
+    if isRef(value):
+        return next(iter(value))
+    return None
+
+def serializeValue(value,parts):
+    # append the PDF syntax for value to the list parts. literal strings are written back raw (with the
+    # escapes they had in the file), so parsed documents round trip byte for byte. new text needs escapeString
+    if value is None:
+        parts.append(b'null')
+    elif value is True:
+        parts.append(b'true')
+    elif value is False:
+        parts.append(b'false')
+    elif isinstance(value,int):
+        parts.append(b'%d' % value)
+    elif isinstance(value,float):
+        text = repr(value)
+        if 'e' in text or 'n' in text:       # PDF reals have no exponent (and no inf/nan)
+            text = f'{value:.10f}'
+        if '.' in text:
+            text = text.rstrip('0').rstrip('.')
+        parts.append(text.encode())
+    elif isinstance(value,Ref):
+        parts.append(b'%d %d R' % value)
+    elif isinstance(value,Name):
+        parts.append(b'/' + RE_NAME_ESCAPE.sub(lambda m: b'#%02X' % m[0][0],value))
+    elif isinstance(value,HexString):
+        parts.append(b'<' + value + b'>')
+    elif isinstance(value,(bytes,bytearray,memoryview)):
+        parts.append(b'(' + bytes(value) + b')')
+    elif isinstance(value,list):
+        parts.append(b'[')
+        for k,v in enumerate(value):
+            if k:
+                parts.append(b' ')
+            serializeValue(v,parts)
+        parts.append(b']')
+    elif isinstance(value,dict):
+        if isRef(value):
+            (objnum,gennum), = value
+            parts.append(b'%d %d R' % (objnum,gennum))
+            return
+        parts.append(b'<<')
+        for k,v in value.items():
+            serializeValue(Name(k),parts)
+            parts.append(b' ')
+            serializeValue(v,parts)
+        parts.append(b'>>')
+    else:
+        raise TypeError(f'cannot write {type(value).__name__} as PDF')
+
+def pdfBytes(value):
+    # PDF syntax for a single value
+    parts = []
+    serializeValue(value,parts)
+    return b''.join(parts)
+
+
+class PdfWriter():
+    # streaming writer over a binary file object. tracks the byte offset of everything written, so the xref
+    # table is built on the fly while objects go straight to the file
+    def __init__(self,f,offset=0):
+        self.f = f
+        self.offset = offset     # byte offset of the next write in the output file
+        self.xref = {}           # {objNum: (offset, genNum)} of objects written
+        
+    def write(self,data):
+        self.f.write(data)
+        self.offset += len(data)
+        
+    def writeObject(self,objnum,gennum,data,source=None):
+        # one 'N G obj ... endobj'. data is an object body as in PdfInterpreter.objects: [value] or [dict, stream].
+        # stream data is written as is (bytes, memoryview or a StreamSpan read from source) with /Length set to match
+        self.xref[objnum] = (self.offset,gennum)
+        self.write(b'%d %d obj\n' % (objnum,gennum))
+        if len(data)==2 and isinstance(data[0],dict):
+            stream = source.streamBytes(data[1]) if source is not None else data[1]
+            streamDict = dict(data[0])
+            streamDict[b'Length'] = len(stream)
+            self.write(pdfBytes(streamDict) + b'\nstream\n')
+            self.write(stream)
+            self.write(b'\nendstream\nendobj\n')
+        else:
+            self.write(b' '.join(pdfBytes(v) for v in data) + b'\nendobj\n')
+            
+    def writeXref(self,trailer,full=True):
+        # xref section for the objects written so far, then trailer, startxref and %%EOF.
+        # full: one subsection from object 0 with gaps marked free. otherwise only runs of written objects (updates)
+        start = self.offset
+        nums = sorted(self.xref)
+        parts = [b'xref\n']
+        if full:
+            size = nums[-1]+1 if nums else 1
+            parts.append(b'0 %d\n' % size)
+            for objnum in range(size):
+                entry = self.xref.get(objnum)
+                parts.append(b'%010d %05d n\r\n' % entry if entry else b'0000000000 65535 f\r\n')
+        else:
+            runs = []
+            for objnum in nums:
+                if runs and objnum == runs[-1][-1]+1:
+                    runs[-1].append(objnum)
+                else:
+                    runs.append([objnum])
+            for run in runs:
+                parts.append(b'%d %d\n' % (run[0],len(run)))
+                parts.extend(b'%010d %05d n\r\n' % self.xref[objnum] for objnum in run)
+        self.write(b''.join(parts))
+        self.write(b'trailer\n' + pdfBytes(trailer) + b'\nstartxref\n%d\n%%%%EOF\n' % start)
+        return start
+
+
+##############################################
+# persistent parse index. a sidecar (or cache directory) file with the xref, the stream spans and the
+# trailer, so reopening a file seen before skips the xref parse and /Length lookups. columns are stored as raw
+# arrays behind a fixed header and loaded from a memory map with array.frombytes, no per-entry parsing
+
+INDEX_MAGIC = b'PDFIDX1' + (b'<' if sys.byteorder == 'little' else b'>')   # native byte order, other order = stale
+INDEX_HEADER = struct.Struct('<8sQq32sIII')   # magic, file size, mtime_ns, fingerprint, n objects, n streams, trailer bytes
+INDEX_OBJECT_COLUMNS = (('I',4),('H',2),('B',1),('Q',8),('Q',8))  # objNum, genNum, kind (0 free, 1 offset a, 2 compressed a/b), a, b
+INDEX_STREAM_COLUMNS = (('I',4),('H',2),('Q',8),('Q',8))          # objNum, genNum, body offset, body length
+
+def indexPath(filename,index):
+    # index=True: sidecar next to the file, otherwise index is a cache directory (file named by path hash)
+    if index is True:
+        return filename + '.pdfidx'
+    os.makedirs(index,exist_ok=True)
+    name = hashlib.blake2b(os.path.abspath(filename).encode(),digest_size=16).hexdigest()
+    return os.path.join(index,name + '.pdfidx')
+
+def fileFingerprint(filename,data,sample=1<<16):
+    # (size, mtime_ns, content hash). the hash covers the first and last 64 KB and the size, so checking it
+    # stays O(1) on huge files. size and mtime catch rewrites and appends (incremental updates change the tail
+    # anyway), the hash only adds same-size edits inside those two windows with a restored mtime. a same-size
+    # edit in the middle of the file with the mtime put back loads a stale index
+    st = os.stat(filename)
+    h = hashlib.blake2b(digest_size=32)
+    h.update(struct.pack('<Q',len(data)))
+    h.update(data[:sample])
+    h.update(data[max(0,len(data)-sample):])
+    return st.st_size,st.st_mtime_ns,h.digest()
+
+
+def parseRange(filename,span,options):
+    # parseParallel worker: [(objNum, genNum, data), ...] for the objects starting in byte range span of filename.
+    # stream bodies always come back as StreamSpans, the parent maps the same file and makes its own views
+    interp = PdfInterpreter(filename,fast=True,useMmap=True,streamBodies=False,**options)
+    interp.payload = interp.data      # bytes slices instead of memoryviews, views can't be pickled back to the parent
+    start,end = span
+    interp.seek(start)
+    # only the top level loop stops at the range end. self.end stays the file length, get_object/streamLength
+    # still need the xref and indirect /Length objects anywhere in the file
+    return [(objnum,gennum,data) for objnum,gennum,data,_ in interp.iter_objects(stop=end)]
+
+
 class PdfInterpreter():
     # char classes.
     CHAR_WS = [0,9,10,12,13,32]                          # + [b'\x00',b'\t',b'\n',b'\x0c',b'\r',b' ']                     
@@ -44,20 +979,135 @@ class PdfInterpreter():
     CHAR_NUM = [48,49,50,51,52,53,54,55,56,57,43,45,46]  # + [b'0',b'1',b'2',b'3',b'4',b'5',b'6',b'7',b'8',b'9',b'+',b'-',b'.']  
     CHAR_NONREG = CHAR_WS + CHAR_DELIM 
     KEYWORDS = ['obj','endobj',b'stream',b'endstream','R','true','false','xref','f','n','trailer','startxref']
+    OBJSTM_CACHE = 16   # decoded object streams kept around for sibling lookups
     
-    def __init__(self,filename):
-        self.data = readBytes(filename)          # reading whole file and iterating gets ~0.5MB/s faster than lazy iterator (yield from fchunk)
-        self.reader = iter(self.data)            # but presumably worse memory performance.
+    def __init__(self,filename,fast=False,useMmap=False,cacheSize=1024,data=None,decodeBudget=64<<20,streamBodies=None,
+                 keepTokens=0,tokenBuffer=False,index=None,stats=False,progress=None,progressEvery=1<<20,recover=True,
+                 compact=False):
+        if data is not None:                     # parse an in-memory buffer (decoded object stream etc.) instead of a file
+            self.data = data
+            self.payload = data
+            self.reader = iter(data)
+        elif useMmap:                              # mmap input: STREAM, STR_LIT and COMMENT tokens from nextTokenFast are memoryview
+            self.data = mapBytes(filename)       # slices into the mapping, payloads are never copied unless used. STR_HEX is
+                                                 # the one exception, a HexString copy (see scanTokens)
+            self.payload = memoryview(self.data)
+            self.reader = iter(self.payload)     # iter(mmap) yields length 1 bytes, memoryview yields ints like bytes does
+        else:
+            self.data = readBytes(filename)          # reading whole file and iterating gets ~0.5MB/s faster than lazy iterator (yield from fchunk)
+            self.payload = self.data                 # slices of payload are token data. bytes here -> copies
+            self.reader = iter(self.data)            # but presumably worse memory performance.
         # self.reader = readBytes(filename)
         
         self.objects = {}  # object dictionary: {(objNum, genNum): [Dict,Stream], ...}
-        self.tokens = []   # stack of tokens
+        self.modified = set()   # keys changed with setObject/addObject since the file was opened
+        self.unappended = set() # keys changed since the last in-place writeIncremental
+        self.wholeDocument = False  # self.objects is the complete document (after optimize), see writableObjects
+        self.appended = None    # (file size, startxref, /Size) after the last in-place writeIncremental
+        # token retention is for debugging only, nothing in the parser reads it back.
+        # keepTokens: 0 = keep nothing, n = ring buffer of the last n tokens, None = keep all.
+        # tokenBuffer: keep them in a compact TokenBuffer (type/offset/length arrays) instead of Token objects,
+        # asking for one means keeping tokens: with the default keepTokens=0 it keeps all of them
+        if tokenBuffer and keepTokens == 0:
+            keepTokens = None
+        if keepTokens == 0:
+            self.tokens = None
+        elif tokenBuffer:
+            self.tokens = TokenBuffer(keepTokens)
+            self.newToken = self.newTokenBuffered
+        else:
+            self.tokens = [] if keepTokens is None else deque(maxlen=keepTokens)
+            self.newToken = self.newTokenKept
         self.bytes = []   # stack of read bytes
-        self.pos = -1      # current byte offset into file such that file[pos]=bytes[-1]. 0=first byte
+        self.pos = -1      # current byte offset into file such that file[pos]=bytes[-1]. 0=first byte. legacy tokenizer only
         self.line = 1      # current line number, delim by /n, /r, or /r/n
         self.peek = 0      # current 'look ahead' in file. nextByte returns from byte stack
         self.xrefLoc = None
         self.EOF = False
+        self.lastDict = None          # last dictionary nextObject built, gives the /Length of a following stream
+        # compact value model: references are Ref tuples (shared through internRef) instead of
+        # {(objNum, genNum): 'REF'} dicts, literal strings are bytes copies instead of views of the mapping (a short
+        # bytes object is ~150 bytes smaller than a memoryview) and stream bodies default to StreamSpan handles.
+        # names are always interned. see benchmark_pdf.py -t objects -t objects-compact for what that saves
+        self.compact = compact
+        if compact:
+            self.newRef = internRef
+        if streamBodies is None:
+            streamBodies = not compact
+        self.streamBodies = streamBodies  # False: STREAM token data is a StreamSpan(offset, length), body is not read
+        
+        self.xref = {}                # {(objNum, genNum): byte offset} from xref tables/streams, see loadXref
+        self.xrefCompressed = {}      # {objNum: (objStmNum, index)} for objects stored in object streams (gen is always 0)
+        self.xrefFree = set()         # object numbers whose newest xref entry is free (deleted by an update)
+        self.objStreams = OrderedDict()  # LRU of decoded object streams, {objStmNum: (interpreter over decoded data, offsets)}
+        self.trailer = {}             # merged trailer dictionary, newest section wins
+        self.xrefLoaded = False
+        self.recover = recover        # rebuild a damaged xref from an object header sweep (rebuildXref) instead of failing
+        self.recovered = False
+        self.cache = OrderedDict()    # LRU of objects loaded by get_object, keyed like self.objects
+        self.cacheSize = cacheSize
+        self.decoded = DecodeCache(decodeBudget)  # decoded stream data by (objNum, genNum), see streamData
+        self.streamLengths = {}       # {stream body offset: length}, from the index. streamBody trusts these over /Length
+        self.indexSpans = {}          # {(objNum, genNum): StreamSpan of the body}, the stream table of the index
+        self.refs = {}                # {(objNum, genNum): ObjectRef}, proxies of the lazy document model
+        self.fonts = {}               # {(objNum, genNum): text decoder} for fonts seen by text extraction
+        self.digests = {}             # {(objNum, genNum): digest of the raw stream bytes}, see objectDigest
+        
+        self.filename = filename
+        self.fast = fast
+        self.cursor = 0               # fast mode: offset of the next unscanned byte
+        self.end = len(self.data)     # fast mode: scan stops here
+        self.scanner = self.scanToken = None
+        if fast:                      # bulk scanner instead of the nextByte() state machine. nextObject, tokenize etc.
+            self.nextToken = self.nextTokenFast  # all go through self.nextToken so swapping the bound method is enough
+            self.useScanner(self.scanTokens())
+        
+        # instrumentation, off by default. same trick: wrap whichever tokenizer is active, nothing else changes,
+        # so a plain run pays nothing for it. progress(position, size, bytes per second) every progressEvery bytes
+        self.stats = ParseStats() if stats else None
+        self.progress = progress
+        if stats or progress:
+            self.tokenizer = self.nextToken
+            self.inToken = False          # legacy nextToken calls self.nextToken again to skip whitespace
+            self.progressEvery = progressEvery
+            self.progressAt = progressEvery
+            self.progressStart = None     # (perf_counter, position) of the first token, throughput is measured from there
+            self.nextToken = self.nextTokenCounted
+        # readObjectData/iter_objects read (type, data, pos) tuples, straight from the scanner unless something
+        # needs Token objects
+        if self.nextToken == self.nextTokenFast and self.tokens is None:
+            self.nextTuple = self.scanToken
+        else:
+            self.nextTuple = self.nextTokenTuple
+        
+        self.indexPath = None
+        if index and filename is not None:    # True = sidecar file, or a cache directory
+            try:
+                self.indexPath = indexPath(filename,index)
+            except OSError as e:              # cache directory can't be created. the index is optional, open without
+                print(f'no index for {filename}: {e}')
+        if self.indexPath is not None:
+            if not self.loadIndex():          # missing or stale: build from the xref and save for next time
+                self.buildIndex()
+                self.saveIndex()
+        
+    def close(self):
+        # release the mapping in mmap mode. views still held by tokens/objects keep it open until they are gone
+        if self.scanner is not None:
+            self.scanner.close()      # a suspended finditer holds a buffer of the mapping
+        if isinstance(self.data,mmap.mmap):
+            self.reader = iter(())
+            self.payload.release()
+            try:
+                self.data.close()
+            except BufferError:
+                pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self,*exc):
+        self.close()
         
     def flushStack(self):
         # flushes stack, returns buffered bytes. 
@@ -67,7 +1117,8 @@ class PdfInterpreter():
         return stack
     
     def pushToken(self,token:Token):
-        self.tokens.append(token)
+        if self.tokens is not None:
+            self.tokens.append(token)
 
     # @profile
     def popByte(self,n=1):
@@ -88,10 +1139,52 @@ class PdfInterpreter():
         return None
         
     def newToken(self,token_type,data,position) -> Token:
+        return Token(token_type,data,position)
+    
+    def newTokenKept(self,token_type,data,position) -> Token:
+        # newToken when keeping tokens, swapped in by __init__ so the default path pays nothing
         t = Token(token_type,data,position)
         self.tokens.append(t)
         return t
     
+    def newTokenBuffered(self,token_type,data,position) -> Token:
+        self.tokens.append(token_type,position,self.tell()-position)
+        return Token(token_type,data,position)
+    
+    def newRef(self,objnum,gennum):
+        return {(objnum,gennum): 'REF'}
+    
+    def nextTokenCounted(self):
+        # instrumented self.nextToken (stats/progress), calls the real tokenizer saved in self.tokenizer
+        if self.inToken:
+            return self.tokenizer()
+        self.inToken = True
+        t0 = time.perf_counter()
+        try:
+            token = self.tokenizer()
+        finally:
+            self.inToken = False
+        t1 = time.perf_counter()
+        stats = self.stats
+        if stats is not None:
+            if stats.first is None:
+                stats.first = t0
+            stats.last = t1
+            stats.tokenTime += t1-t0
+            if token:
+                stats.tokens[token.type] += 1
+                stats.tokenBytes[token.type] += self.tell()-token.pos
+        if self.progress is not None:
+            if self.progressStart is None:
+                self.progressStart = (t0,self.tell())
+            atEnd = not token and self.EOF
+            position = self.end if atEnd else self.tell()    # legacy tell() trails by the byte it failed to read
+            if position >= self.progressAt or atEnd:
+                self.progressAt = position + self.progressEvery
+                since,begin = self.progressStart
+                self.progress(position,self.end,(position-begin)/max(t1-since,1e-9))
+        return token
+    
     # @profile
     def nextToken(self):
         # parse non-recurive PDF syntax tokens (ie. will make a token for a comment, but the parser will have to handle nested dictionaries etc)
@@ -108,13 +1201,13 @@ class PdfInterpreter():
         b = self.nextByte()
         
         pos=self.pos-self.peek       # start position (byte offset) of this token
-        token_type = 'NONE'
+        token_type = NONE
         data=None
         
         if b in self.CHAR_WS:  # consume all whitespace chars including spaces and newline as one (7.2.3)
-            token_type = 'CHAR_EOL' if b in self.CHAR_EOL else 'CHAR_WS'
+            token_type = CHAR_EOL if b in self.CHAR_EOL else CHAR_WS   # token codes, not the char class lists
             while (b:=self.nextByte()) in self.CHAR_WS:
-                if b in self.CHAR_EOL: token_type = 'CHAR_EOL'  # no diff between ' \n', '     \n', '\n'. all EOL tokens
+                if b in self.CHAR_EOL: token_type = CHAR_EOL  # no diff between ' \n', '     \n', '\n'. all EOL tokens
                 continue
             self.peek += 1
             self.flushStack()
@@ -122,29 +1215,33 @@ class PdfInterpreter():
             return self.nextToken()  # whitespace and newline serve no semantic purpose, so skip these tokens. We can insert them when rebuilding the document according to rules.
             
         elif b in self.CHAR_NUM:
-            token_type = 'NUM_INT'
+            token_type = NUM_INT
             while (p:=self.nextByte()) in self.CHAR_NUM:
                 if p == 46: # b'.'
                     if self.nextByte() in self.CHAR_NUM: # if decimal encountered followed by another numeric, then its a REAL (float). ex. '4.' does not need to be a float, it can be '4'
-                        token_type = 'NUM_REAL'
+                        token_type = NUM_REAL
                     else:                               # skip decimal seperator if is not followed by number since it will mess up the int evaluation (int(b'4.') does not work)
                         pop = self.popByte(2)           # pop '.{^d}'
                         self.bytes.append(pop[-1])      # return non-numeric ^d to stack
                         self.peek += 1
             self.peek += 1
             data = self.flushStack()
-            data = int(bytes(data)) if token_type=='NUM_INT' else float(bytes(data))
+            try:
+                data = int(bytes(data)) if token_type==NUM_INT else float(bytes(data))
+            except ValueError:                      # '-', '--5', '1.2.3' etc. readers take these as 0 (see iterContent)
+                token_type = NUM_INT
+                data = 0
 
         elif b in self.CHAR_DELIM:          
             if b==37:  # b'%':                           
                 self.popByte()
-                token_type = 'COMMENT'
-                while self.nextByte() not in self.CHAR_EOL: continue
+                token_type = COMMENT
+                while (p:=self.nextByte()) not in self.CHAR_EOL and p is not None: continue   # None: comment ends the file
                 self.peek += 1
                 data = bytes(self.flushStack())   # save comment text, because %PDF-1.x, %bbbb, and %%EOF will tokenize as comments and we should check for them in the builder
             
             elif b==40:  # b'(':
-                token_type = 'STR_LIT'
+                token_type = STR_LIT
                 self.popByte()                 # pop '(' delim
                 n=1
                 while n>0:
@@ -160,28 +1257,28 @@ class PdfInterpreter():
             
             elif b==47:  # b'/':
                 self.popByte()
-                token_type = 'NAME'           
+                token_type = NAME           
                 while self.nextByte() not in self.CHAR_NONREG: continue
                 self.peek += 1
-                data = bytes(self.flushStack())
+                data = internName(bytes(self.flushStack()))
             
             elif b==60:  # b'<':
                 self.popByte()
                 if self.nextByte()==60:  # b'<':         # dict_begin '<<' token
-                    token_type = 'DICT_BEGIN'
+                    token_type = DICT_BEGIN
                     self.popByte()
                     # data = None
                 else:
-                    token_type = 'STR_HEX'
+                    token_type = STR_HEX
                     while not self.nextByte()==62:  # b'>': 
                         continue
                     self.popByte()
-                    data = bytes(self.flushStack())
+                    data = HexString(self.flushStack())
                         
             elif b==62:  # b'>':
                 self.popByte()
                 if self.nextByte()==62:  # b'>':
-                    token_type = 'DICT_END'
+                    token_type = DICT_END
                     self.popByte()
                     # data = None
                 else:
@@ -191,25 +1288,25 @@ class PdfInterpreter():
                 
             elif b==91:  # b'[':
                 self.popByte()
-                token_type = 'ARR_BEGIN'
+                token_type = ARR_BEGIN
                 # data=None
             elif b==93:  # b']':
                 self.popByte()
-                token_type = 'ARR_END'
+                token_type = ARR_END
                 # data=None
                 
             elif b==123:  # b'{':
                 self.popByte()
-                token_type = 'FN_BEGIN'
+                token_type = FN_BEGIN
                 # data=None
             elif b==125:  # b'}':
                 self.popByte()
-                token_type = 'FN_END'
+                token_type = FN_END
                 # data = None  
                         
             else:
                 print(f'unhandled delim {b} at line {self.line}, byte {pos}')
-                token_type = 'DELIM'
+                token_type = DELIM
                 data = self.flushStack() 
      
         else: # not whitespace, numeric, or delim. scan for regular chars
@@ -219,69 +1316,234 @@ class PdfInterpreter():
             keyword = bytes(self.flushStack())
             
             if keyword == b'R':
-                token_type = 'OBJ_REF'
+                token_type = OBJ_REF
                 # last two tokens are ints, if we ignore whitespace.. can get the last two tokens for object/generation numbers
                 # objnum = self.tokens[-2]
                 # gennum = self.tokens[-1]
                 # data = (objnum.data, gennum.data)
                 # pos = objnum.pos              
             elif keyword == b'n':
-                token_type = 'XREF_INUSE'
+                token_type = XREF_INUSE
                 # data = None
             elif keyword == b'obj':
-                token_type = 'OBJ_BEGIN'
+                token_type = OBJ_BEGIN
                 # last two tokens are ints, if we ignore whitespace.. can get the last two tokens for object/generation numbers
                 # objnum = self.tokens[-2]
                 # gennum = self.tokens[-1]
                 # data = (objnum.data, gennum.data)
                 # pos = objnum.pos
             elif keyword == b'endobj':
-                token_type = 'OBJ_END'
+                token_type = OBJ_END
                 # data=None
             elif keyword == b'stream':
-                token_type = 'STREAM'
-                stream=True
-                self.nextByte()  # 'stream' shall be followed by newline
-                self.popByte()
-                while stream:  
-                    if self.nextByte() in self.CHAR_EOL:                   
-                        while self.nextByte() in self.CHAR_EOL: continue
-                        if self.bytes[-1]==101:                    # 101 = ord(b'e')
-                            if bytes(self.nextBytes(8)) == b'ndstream':  
-                                self.popByte(10)  # pop '\nendstream' from stack
-                                data = bytes(self.flushStack())
-                                # data = (len(data),data)  # for checking consistency with /Length data preceeding string
-                                stream = False
-                            else:
-                                self.peek += 8
+                token_type = STREAM
+                # streams are most of the bytes in a file, don't walk them through nextByte(). jump by /Length
+                # (or find 'endstream') and restart the byte reader behind 'endstream'
+                k = self.pos-self.peek+1          # first byte after 'stream', the peeked EOL is still on the stack
+                if k<self.end and self.data[k]==13: k += 1     # 'stream' shall be followed by \r\n or \n
+                if k<self.end and self.data[k]==10: k += 1
+                data,j = self.streamBody(k)
+                self.seek(j)
             elif keyword == b'null':
-                token_type = 'NULL'
+                token_type = NULL
                 # data = None
             elif keyword == b'false':
-                token_type = 'BOOL'
+                token_type = BOOL
                 data = False
             elif keyword == b'true':
-                token_type = 'BOOL'
+                token_type = BOOL
                 data = True
             elif keyword == b'xref':
-                token_type = 'XREF_BEGIN'
+                token_type = XREF_BEGIN
                 # data = None
                 # self.xrefLoc = pos
             elif keyword == b'f':
-                token_type = 'XREF_FREE'
+                token_type = XREF_FREE
                 # data = None
             elif keyword == b'trailer':
-                token_type = 'TRAILER'
+                token_type = TRAILER
                 # data = None
             elif keyword == b'startxref':
-                token_type = 'XREF_LOC'
+                token_type = XREF_LOC
                 # data = None    
             else:
                 print(f'unhandled keyword {keyword}')
-                token_type = 'REG'  # should never get here.
-        return self.newToken(token_type, data, pos)               # appends token to class token list self.tokens. useful for debugging, not nedd for function
+                token_type = REG  # should never get here.
+        return self.newToken(token_type, data, pos)               # appends token to class token list self.tokens if enabled. useful for debugging, not nedd for function
         # return Token(token_type,data,pos)                       # returns token, does NOT save to list
     
+    # @profile
+    def nextTokenFast(self):
+        # bulk-scan tokenizer behind self.nextToken in fast mode: scanToken's tuple as a Token
+        t = self.scanToken()
+        return self.newToken(*t) if t else t
+    
+    def useScanner(self,scanner):
+        # make scanner (a scanTokens generator) the one behind self.scanToken, returns the one it replaces
+        old = self.scanner
+        self.scanner = scanner
+        if old is not None and self.nextTuple == self.scanToken:
+            self.nextTuple = scanner.__next__
+        self.scanToken = scanner.__next__
+        return old
+    
+    def nextTokenTuple(self):
+        # (type, data, pos) from whatever self.nextToken is. self.nextTuple when scanToken can't be used directly
+        # (legacy tokenizer, instrumentation or kept tokens, those all need the Token objects)
+        token = self.nextToken()
+        return (token.type,token.data,token.pos) if token else token
+    
+    def scanTokens(self):
+        # bulk-scan tokenizer, the generator behind self.scanToken in fast mode. one RE_TOKEN.finditer pass over
+        # self.data from self.cursor, each match skips the whitespace in front of a token and takes the whole run
+        # (name, number, keyword, << >>). the pass only restarts behind comments, strings and streams, which jump
+        # with search()/find(), or when the cursor or end was moved between tokens (seek, loadObjStm).
+        # same token types, data and positions as nextToken, but as (type, data, pos) tuples: readObjectData and
+        # iter_objects unpack them right away, a Token object per token was ~1/3 of the time. False at the end,
+        # on every call until a seek
+        while True:
+            data = self.data
+            payload = self.payload       # slices of payload become token data (bytes, or memoryview in mmap mode)
+            strings = self.data if self.compact else payload      # compact: literal strings are bytes copies
+            end = self.end
+            for m in RE_TOKEN.finditer(data,self.cursor,end):
+                group = m.lastindex
+                pos = m.start(group)
+                e = j = m.end()
+                
+                if group == 1:  # numeric
+                    num = m.group(1)
+                    if num[-1] == 46:            # '4.' is an int, drop trailing decimal seperator like nextToken
+                        num = num[:-1]
+                    try:
+                        token = (NUM_REAL,float(num),pos) if 46 in num else (NUM_INT,int(num),pos)
+                    except ValueError:           # '-', '--5', '1.2.3' etc. readers take these as 0 (see iterContent)
+                        token = (NUM_INT,0,pos)
+                elif group == 2:  # /name, token starts at the '/'
+                    token = (NAME,internName(m.group(2)),pos-1)
+                elif group == 3:
+                    token = (OBJ_REF,None,pos)
+                elif group == 4:
+                    token = (DICT_BEGIN,None,pos)
+                elif group == 5:
+                    token = (DICT_END,None,pos)
+                elif group == 6:
+                    token = (ARR_BEGIN,None,pos)
+                elif group == 7:
+                    token = (ARR_END,None,pos)
+                elif group == 8:  # keyword
+                    keyword = m.group(8)
+                    token_type = KEYWORD_TOKENS.get(keyword)
+                    data_ = None
+                    if token_type is None:
+                        if keyword == b'stream':
+                            token_type = STREAM
+                            k = j
+                            if k<end and data[k]==13: k += 1     # 'stream' shall be followed by \r\n or \n
+                            if k<end and data[k]==10: k += 1
+                            data_,j = self.streamBody(k)
+                        else:
+                            print(f'unhandled keyword {keyword}')
+                            token_type = REG
+                    elif token_type == BOOL:
+                        data_ = keyword == b'true'
+                    token = (token_type,data_,pos)
+                    
+                else:  # single delimiter
+                    b = data[pos]
+                    if b==40:  # b'('
+                        j = literalEnd(data,j,end)
+                        token = (STR_LIT,strings[pos+1:j-1],pos)
+                        j = min(j,end)
+                    elif b==60:  # b'<', << is group 4
+                        k = data.find(b'>',j,end)
+                        if k<0: k = end
+                        token = (STR_HEX,HexString(payload[j:k]),pos)   # a copy even in mmap mode: a memoryview can't carry the
+                                                                         # HexString type the writer and stringBytes go by, and hex strings are short
+                        j = min(k+1,end)
+                    elif b==37:  # b'%'
+                        s = RE_EOL.search(data,j,end)
+                        j = s.start() if s else end
+                        token = (COMMENT,payload[pos+1:j],pos)
+                    elif b==62:  # b'>', >> is group 5
+                        print(f'error at pos {pos}: single > when >> expected')
+                        token = None
+                    elif b==123:
+                        token = (FN_BEGIN,None,pos)
+                    elif b==125:
+                        token = (FN_END,None,pos)
+                    elif b in self.CHAR_WS:              # (.) only takes whitespace when nothing but whitespace is left
+                        self.EOF = True
+                        token = False
+                    else:
+                        print(f'unhandled delim {b} at line {self.lineAt(pos)}, byte {pos}')
+                        token = (DELIM,[b],pos)
+                
+                self.cursor = j
+                yield token
+                if j != e or self.cursor != j or self.end != end:   # jumped past the match, or moved by a seek
+                    break
+            else:
+                self.cursor = end
+                self.EOF = True
+                yield False
+    
+    def streamBody(self,k):
+        # stream data starting at byte k (behind the EOL after 'stream'). returns (data, offset behind 'endstream').
+        # jumps straight to the end by /Length of the dictionary in front of the stream, and only searches for
+        # 'endstream' when the length is unknown or does not land on it (binary data can contain '\nendstream')
+        data = self.data
+        end = self.end
+        length = self.streamLengths.get(k)
+        if length is None:
+            length = self.streamLength()
+        else:
+            self.lastDict = None      # span known from the index, skip /Length (and an indirect length lookup)
+        m = RE_ENDSTREAM.match(data,k+length,end) if length is not None else None
+        if m:
+            e = k+length
+            j = m.end()
+        else:
+            e = data.find(b'endstream',k,end)
+            if e<0: e = end
+            j = min(e+9,end)
+            if e>k and data[e-1]==10: e -= 1     # EOL before endstream is not part of the data
+            if e>k and data[e-1]==13: e -= 1
+        if self.streamBodies:
+            return self.payload[k:e],j
+        return StreamSpan(k,e-k),j
+    
+    def streamLength(self):
+        # /Length of the dictionary nextObject finished right before 'stream', None if there is none.
+        # an indirect length is loaded with get_object, which puts the tokenizer back where it was
+        d,self.lastDict = self.lastDict,None
+        if d is None:
+            return None
+        length = d.get(b'Length')
+        if isRef(length):
+            if self.fast and self.scanner.gi_running:    # called from the scanner at 'stream': read with a second one
+                cursor = self.cursor
+                outer = self.useScanner(self.scanTokens())
+                length = self.resolve(length)
+                self.useScanner(outer).close()
+                self.seek(cursor)
+            else:
+                length = self.resolve(length)
+        if isinstance(length,int) and length>=0:
+            return length
+        return None
+    
+    def streamBytes(self,data):
+        # stream data for a STREAM token/object value, reading the body if it was only recorded as a StreamSpan
+        if isinstance(data,StreamSpan):
+            return self.payload[data.offset:data.offset+data.length]
+        return data
+    
+    def lineAt(self,pos):
+        # line number of byte offset pos, /r/n counts once. only needed for error messages in fast mode
+        data = self.data[:pos]    # mmap has no count()
+        return data.count(b'\n') + data.count(b'\r') - data.count(b'\r\n') + 1
+    
     # @profile    
     def nextByte(self):       # peek bool allows us to read the next byte without inc counters etc..         
                                 # code duplication. but, large speed increase from unrolling for loop in 
@@ -348,77 +1610,1430 @@ class PdfInterpreter():
         self.objects[key] = data
         return key
     
-    def nextObject(self,stack=[]):
+    def nextObject(self,stack=None):
+        # recursive object builder. one call per top level token, containers and object bodies are handed to
+        # readObjectData so long arrays/dicts don't hit the recursion limit. see iter_objects for a generator
+        if stack is None:   # no shared mutable default, leftovers would leak into the next call
+            stack = []
         if self.EOF:
             return False
         token = self.nextToken()
-        if token.type in ['NUM_REAL','NUM_INT','STR_LIT','STR_HEX','BOOL','NAME','STREAM','NULL']:
+        if not token:   # EOF, or error already reported by the tokenizer
+            return False
+        if token.type in VALUE_TOKENS:
             stack.append(token.data)
             return self.nextObject(stack)
-        elif token.type in ['DICT_BEGIN','ARR_BEGIN']:
-            stack.append(self.nextObject([]))
+        elif token.type in [DICT_BEGIN,ARR_BEGIN]:
+            stack.append(self.readObjectData())
             return self.nextObject(stack)
-        elif token.type == 'OBJ_REF':
+        elif token.type == OBJ_REF:
             gennum,objnum = stack.pop(),stack.pop()
-            stack.append({(objnum,gennum): 'REF'})
+            stack.append(self.newRef(objnum,gennum))
             return self.nextObject(stack)
-        elif token.type == 'OBJ_BEGIN':
+        elif token.type == OBJ_BEGIN:
             gennum,objnum = stack.pop(),stack.pop()
-            objdata = self.nextObject([])
+            objdata = self.readObjectData()
             return self.newObject(objnum,gennum,objdata)   # TOP LEVEL BASE CASE
-        elif token.type == 'DICT_END':
-            return dict(zip(stack[::2],stack[1::2]))  # make key/value pairs of stack objects
-        elif token.type in ['ARR_END','OBJ_END']:
+        elif token.type == DICT_END:
+            self.lastDict = dict(zip(stack[::2],stack[1::2]))  # make key/value pairs of stack objects
+            return self.lastDict
+        elif token.type in [ARR_END,OBJ_END]:
             return stack
-        elif token.type == 'COMMENT':
+        elif token.type == COMMENT:
             return self.nextObject(stack)
-        elif token.type == 'XREF_BEGIN':  #'xref' keyword, start of xref table
+        elif token.type == XREF_BEGIN:  #'xref' keyword, start of xref table
             # build xref table here
             return False
-        elif token.type == 'XREF_LOC':  # 'startxref' kw, next token is byte offset of xref location
+        elif token.type == XREF_LOC:  # 'startxref' kw, next token is byte offset of xref location
             # get next int token here
             return False
-        elif token.type == 'TRAILER':
+        elif token.type == TRAILER:
             # build trailer here. its just a dictionary, so safe to call nextObj here          
             return False
         else:
             print(f'unhandled token {token}')
             print(f'{stack=}')
             return False
+    
+    def readObjectData(self):
+        # iterative equivalent of nextObject([]): values up to the closing token at this depth. returns a dict
+        # for DICT_END, the list of values for ARR_END/OBJ_END. open containers live on an explicit stack
+        # (frames) instead of the call stack, so depth and length are only limited by memory.
+        # straight off the scanner (plain fast mode) the common tokens (numbers, names, [ ] << >>, R, endobj) are
+        # read here in one RE_TOKEN.finditer pass, without a token tuple each. anything else goes to the scanner
+        frames = []
+        stack = []
+        nextTuple = self.nextTuple
+        newRef = self.newRef
+        inline = nextTuple == self.scanToken
+        namesGet = NAMES.get
+        strings = self.data if self.compact else self.payload     # as in scanTokens
+        jump = False           # the inline pass stopped behind a string or comment, not at a token for the scanner
+        data = self.data
+        while True:
+            if inline:
+                end = self.end
+                for m in RE_TOKEN.finditer(data,self.cursor,end):
+                    group = m.lastindex
+                    if group == 1:
+                        num = m.group(1)
+                        try:
+                            stack.append(int(num))
+                        except ValueError:                 # reals, and the malformed numbers scanTokens reads as 0
+                            if num[-1] == 46:
+                                num = num[:-1]
+                            try:
+                                stack.append(float(num) if 46 in num else int(num))
+                            except ValueError:
+                                stack.append(0)
+                    elif group == 2:
+                        raw = m.group(2)
+                        name = namesGet(raw)
+                        stack.append(internName(raw) if name is None else name)
+                    elif group == 3:
+                        if len(stack) >= 2:            # a stray R without 'N G' in front is dropped
+                            gennum = stack.pop()
+                            stack[-1] = newRef(stack[-1],gennum)
+                    elif group == 4 or group == 6:
+                        frames.append(stack)
+                        stack = []
+                    elif group == 5:
+                        value = self.lastDict = dict(zip(stack[::2],stack[1::2]))
+                        if not frames:
+                            self.cursor = m.end()
+                            return value
+                        stack = frames.pop()
+                        stack.append(value)
+                    elif group == 7 or group == 8 and m.group(8) == b'endobj':
+                        if not frames:
+                            self.cursor = m.end()
+                            return stack
+                        value = stack
+                        stack = frames.pop()
+                        stack.append(value)
+                    else:
+                        pos = m.start(group)
+                        if group == 9 and data[pos] == 40:       # '(' string, then a new pass behind it
+                            j = literalEnd(data,pos+1,end)
+                            stack.append(strings[pos+1:j-1])
+                            self.cursor = min(j,end)
+                            jump = True
+                        elif group == 9 and data[pos] == 37:     # '%' comment
+                            s = RE_EOL.search(data,pos+1,end)
+                            self.cursor = s.start() if s else end
+                            jump = True
+                        else:                              # streams, hex strings etc.: the scanner reads from here
+                            self.cursor = m.start()
+                        break
+                else:
+                    self.cursor = end
+                if jump:
+                    jump = False
+                    continue
+            token = nextTuple()
+            if not token:
+                if self.EOF:
+                    print(f'unexpected EOF in object at byte {self.tell()}')
+                    return None
+                continue                                  # tokenizer already reported the error
+            t = token[0]
+            if t in VALUE_TOKENS:
+                stack.append(token[1])
+            elif t == DICT_BEGIN or t == ARR_BEGIN:
+                frames.append(stack)
+                stack = []
+            elif t == OBJ_REF:
+                if len(stack) >= 2:
+                    gennum = stack.pop()
+                    stack[-1] = newRef(stack[-1],gennum)
+            elif t == DICT_END:
+                value = self.lastDict = dict(zip(stack[::2],stack[1::2]))
+                if not frames:
+                    return value
+                stack = frames.pop()
+                stack.append(value)
+            elif t == ARR_END or t == OBJ_END:
+                if not frames:
+                    return stack
+                value = stack
+                stack = frames.pop()
+                stack.append(value)
+            elif t != COMMENT:
+                print(f'unhandled token Token<{TOKEN_NAMES[t]}> in object')
+                return frames[0] if frames else stack
+    
+    def iter_objects(self,retain=False,members=True,stop=None):
+        # generator over the objects from the tokenizer position on, yields (objNum, genNum, data, offset) with
+        # data as in self.objects and offset of the 'N G obj' header. only the current object is held unless
+        # retain=True also stores them in self.objects. xref tables, trailers and comments between objects are
+        # skipped instead of ending the parse, so incremental updates are read through to EOF. with members=True
+        # every /Type /ObjStm object is followed by the objects stored in it, offset None (see iterObjStm).
+        # stop: byte offset, ends the generator at the first object header at or past it (parseRange)
+        nums = []        # last two NUM_INT tokens, candidates for 'N G' in front of 'obj'
+        nextTuple = self.nextTuple
+        inline = nextTuple == self.scanToken     # plain fast mode: try the whole 'N G obj' as one match first
+        objAt = RE_OBJ_AT.match
+        while True:
+            header = None
+            if inline and not nums:
+                m = objAt(self.data,self.cursor,self.end)
+                if m:
+                    self.cursor = m.end()
+                    header = int(m[1]),int(m[2]),m.start(1)
+            if header is None:
+                token = nextTuple()
+                if not token:
+                    if self.EOF:
+                        return
+                    continue
+                t = token[0]
+                if t == NUM_INT:
+                    nums.append(token)
+                    if len(nums) > 2:
+                        del nums[0]
+                    continue
+                if t == OBJ_BEGIN and len(nums) == 2:
+                    header = nums[0][1],nums[1][1],nums[0][2]
+                    nums.clear()
+                else:
+                    nums.clear()
+                    if t == DICT_BEGIN:          # trailer dictionary
+                        self.readObjectData()
+                    elif t == XREF_BEGIN:        # jump over the entries of a well formed table, they are ~1/3 of the tokens
+                        m = RE_XREF_BODY.match(self.data,self.tell(),self.end)
+                        if m:
+                            self.seek(m.end()-7)
+                    continue
+            objnum,gennum,offset = header
+            if stop is not None and offset >= stop:
+                return
+            data = self.readObjectData()
+            if data is None:
+                return
+            if retain:
+                self.objects[(objnum,gennum)] = data
+            yield objnum,gennum,data,offset
+            if members and len(data) == 2 and isinstance(data[0],dict) and data[0].get(b'Type') == b'ObjStm':
+                yield from self.iterObjStm(objnum,data,retain)
+    
+    
+    ##############################################
+    # parallel parse. split the file at object boundaries and parse the ranges in worker processes
+    
+    def scanObjectHeaders(self,start=0,end=None):
+        # [(offset, objNum, genNum), ...] of every 'N G obj' header in data[start:end]. bytes.find sweep for 'obj',
+        # then RE_OBJ_TAIL on the few bytes in front of each hit. one RE_OBJ_HEADER sweep is ~70x slower on
+        # stream heavy files, the leading \d+ gets tried at every digit of every stream.
+        # can also hit 'N G obj' inside stream data, callers that care have to check
+        data = self.data
+        end = len(data) if end is None else end
+        find = data.find
+        tail = RE_OBJ_TAIL.search
+        headers = []
+        k = find(b'obj',start,end)
+        while k >= 0:
+            if k > start and data[k-1] in CHAR_WS_BYTES and not data[k+3:k+4].isalnum():   # not endobj/objx
+                m = tail(data,max(start,k-64),k+3)
+                if m:
+                    headers.append((m.start(),int(m[1]),int(m[2])))
+            k = find(b'obj',k+3,end)
+        return headers
+    
+    def objectBoundaries(self):
+        # sorted object start offsets: from the xref when there is one, otherwise from a header scan
+        offsets = set(self.loadXref().values())
+        if not offsets:
+            offsets = {offset for offset,_,_ in self.scanObjectHeaders()}
+        return sorted(offsets)
+    
+    def parseParallel(self,workers=None,minChunk=1<<20):
+        # parse the whole file with a process pool and merge the results into self.objects. the file is cut into
+        # ranges at object boundaries (about 4 per worker, none smaller than minChunk bytes), every worker maps
+        # the file and runs iter_objects over its range. ranges are merged in file order, so like a linear
+        # parse the last definition of an object wins. returns self.objects
+        size = len(self.data)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        nchunks = min(workers*4,size//minChunk)
+        if self.filename is None or workers < 2 or nchunks < 2:      # not worth the processes, parse here
+            self.seek(0)
+            for _ in self.iter_objects(retain=True):
+                pass
+            return self.objects
+        offsets = self.objectBoundaries()
+        cuts = sorted({0} | {offsets[len(offsets)*k//nchunks] for k in range(1,nchunks)} if offsets else {0})
+        ranges = list(zip(cuts,cuts[1:]+[size]))
+        # names and refs are interned as they unpickle (Name/Ref.__reduce__), so the merged table shares them
+        # like a serial parse without another pass over the values
+        options = {'compact':self.compact}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for objects in pool.map(parseRange,[self.filename]*len(ranges),ranges,[options]*len(ranges)):
+                for objnum,gennum,data in objects:
+                    if self.streamBodies and len(data) == 2 and isinstance(data[1],StreamSpan):
+                        data[1] = self.streamBytes(data[1])
+                    self.objects[(objnum,gennum)] = data
+        return self.objects
+    
+    
+    ##############################################
+    # random access. read startxref -> xref table -> trailer (following /Prev), then parse single objects by offset
+    
+    def tell(self):
+        # offset of the next byte the tokenizer will read
+        if self.fast:
+            return self.cursor
+        return self.pos - self.peek + 1
+    
+    def seek(self,offset):
+        # move the tokenizer to byte offset. drops the legacy byte stack, so only call between tokens
+        self.EOF = False
+        self.pos = offset-1
+        if self.fast:
+            self.cursor = offset
+        else:
+            self.reader = iter(memoryview(self.data)[offset:])   # view, does not copy the rest of the file
+            self.bytes = []
+            self.peek = 0
+    
+    def findStartXref(self):
+        # byte offset of the last xref section, from 'startxref' near the end of file
+        k = self.data.rfind(b'startxref',max(0,len(self.data)-2048))
+        if k<0:
+            print('startxref not found')
+            return None
+        self.seek(k+9)
+        token = self.nextToken()
+        if not token or token.type != NUM_INT:
+            print(f'bad startxref at byte {k}')
+            return None
+        return token.data
+    
+    def loadXref(self):
+        # build self.xref and self.trailer. sections are read newest first, so the first entry seen for an
+        # object number wins and older (/Prev) sections only fill in what later updates did not touch
+        if self.xrefLoaded:
+            return self.xref
+        self.xrefLoaded = True
+        saved = self.tell()
+        seen = set()        # object numbers already decided by a newer section (in use or free)
+        visited = set()     # section offsets, guards against /Prev loops
+        offset = self.findStartXref()
+        damaged = offset is None
+        while offset is not None and offset not in visited:
+            visited.add(offset)
+            try:
+                trailer = self.readXrefSection(offset,seen)
+            except (TypeError,ValueError,KeyError,IndexError) as e:     # garbage where numbers or keys should be
+                print(f'bad xref section at byte {offset}: {e!r}')
+                trailer = None
+            if trailer is None:
+                damaged = True        # broken startxref or /Prev, or a section cut off
+                break
+            for key,value in trailer.items():
+                self.trailer.setdefault(key,value)
+            offset = trailer.get(b'Prev')
+        self.xrefFree = seen - {objnum for objnum,_ in self.xref} - set(self.xrefCompressed)
+        self.seek(saved)
+        if self.recover and (damaged or not self.xrefIntact()):
+            print('xref damaged, rebuilding it from object headers')
+            return self.rebuildXref()
+        return self.xref
+    
+    def xrefIntact(self,samples=XREF_SAMPLES):
+        # spot check: a few xref offsets, spread over the table, point at the header of their object (whitespace
+        # in front tolerated). checking every entry costs ~1us per object on every open, and shifted offsets
+        # usually shift all of them. anything the sample misses is caught by get_object, which rebuilds on
+        # the first object that isn't where the xref says
+        match = RE_OBJ_AT.match
+        data = self.data
+        entries = list(self.xref.items())
+        step = max(1,len(entries)//samples)
+        for (objnum,_),offset in entries[::step]+entries[-1:]:
+            m = match(data,offset)
+            if m is None or int(m[1]) != objnum:
+                return False
+        return True
+    
+    def skipStreamBodies(self,headers):
+        # drop the scanObjectHeaders hits that lie inside the stream data of an earlier object. a 'stream'
+        # keyword between a kept header and the next hit means the object has a stream, every hit up to its
+        # end (direct /Length when it lands on endstream, else the next 'endstream') is stream bytes that
+        # happen to look like 'N G obj'
+        data = self.data
+        kept = []
+        skip = 0
+        for i,header in enumerate(headers):
+            offset = header[0]
+            if offset < skip:
+                continue
+            kept.append(header)
+            nxt = headers[i+1][0] if i+1 < len(headers) else len(data)
+            k = data.find(b'stream',offset,nxt)
+            if k < 0 or data[k-3:k] == b'end':
+                continue
+            body = k+6 + (2 if data[k+6:k+8] == b'\r\n' else 1)
+            m = RE_STREAM_LENGTH.search(data,offset,k)
+            if m and RE_ENDSTREAM.match(data,body+int(m[1])):
+                skip = body+int(m[1])
+            else:
+                end = data.find(b'endstream',body)
+                skip = len(data) if end < 0 else end
+        return kept
+    
+    def rebuildXref(self):
+        # recovery for damaged files (bad startxref, shifted offsets, truncated tail): forget the xref and
+        # rebuild it from sweeps over the whole buffer, then everything else (get_object, pages, writer) runs on
+        # top as usual. every 'N G obj' header is an xref entry, the last one for an object number wins like in
+        # an incremental update. trailer and xref stream dictionaries are merged in file order, object stream
+        # members fill in where they come after the last top level copy. returns self.xref
+        saved = self.tell()
+        data = self.data
+        self.xref.clear()
+        self.xrefCompressed.clear()
+        self.xrefFree.clear()
+        self.trailer.clear()
+        self.cache.clear()
+        self.objStreams.clear()
+        self.decoded.clear()
+        self.streamLengths.clear()
+        self.indexSpans.clear()
+        for ref in self.refs.values():
+            ref.reset()
+        self.xrefLoaded = self.recovered = True
+        
+        headers = self.skipStreamBodies(self.scanObjectHeaders())
+        latest = {}         # {objNum: (genNum, offset)} of the last header
+        for offset,objnum,gennum in headers:
+            latest[objnum] = (gennum,offset)
+        for objnum,(gennum,offset) in latest.items():
+            self.xref[(objnum,gennum)] = offset
+        
+        # /Type /XRef, /ObjStm and /Catalog objects, found by a second sweep and mapped back to their header
+        starts = [offset for offset,_,_ in headers]
+        typed = {b'XRef':[],b'ObjStm':[],b'Catalog':[]}
+        for m in RE_RECOVER_TYPE.finditer(data):
+            i = bisect_right(starts,m.start())-1
+            if i >= 0:
+                offset,objnum,gennum = headers[i]
+                if self.xref.get((objnum,gennum)) == offset and (offset,objnum,gennum) not in typed[m[1]][-1:]:
+                    typed[m[1]].append((offset,objnum,gennum))
+        
+        trailers = []       # (offset, dict) of classic trailers and xref stream dictionaries
+        k = data.find(b'trailer')
+        while k >= 0:
+            self.seek(k+7)
+            value = self.readValue()
+            if isinstance(value,dict):
+                trailers.append((k,value))
+            k = data.find(b'trailer',k+7)
+        for offset,objnum,gennum in typed[b'XRef']:
+            read = self.readObjectAt(offset)
+            if read and read[1] and isinstance(read[1][0],dict):
+                trailers.append((offset,read[1][0]))
+        for _,trailer in sorted(trailers,key=lambda t: t[0]):
+            self.trailer.update(trailer)
+        for key in XREF_ONLY_KEYS:     # describe the broken xref, not this one
+            self.trailer.pop(key,None)
+        
+        for stmoffset,stmnum,_ in typed[b'ObjStm']:
+            loaded = self.loadObjStm(stmnum)
+            if loaded is None:
+                continue
+            for index,(objnum,_) in enumerate(loaded[1]):
+                top = latest.get(objnum)
+                if top is None or top[1] < stmoffset:
+                    if top is not None:
+                        self.xref.pop((objnum,top[0]),None)
+                    self.xrefCompressed[objnum] = (stmnum,index)
+        
+        root = self.trailer.get(b'Root')
+        if not isRef(root) or not self.get_object(*refKey(root)):
+            catalogs = [(objnum,gennum) for _,objnum,gennum in typed[b'Catalog']]
+            if not catalogs:              # maybe compressed, only look there when nothing else was found
+                for objnum in self.xrefCompressed:
+                    obj = self.get_object(objnum)
+                    if obj and isinstance(obj[0],dict) and obj[0].get(b'Type') == b'Catalog':
+                        catalogs.append((objnum,0))
+            if catalogs:
+                self.trailer[b'Root'] = self.newRef(*catalogs[-1])
+            else:
+                print('no catalog found while rebuilding xref')
+        self.trailer[b'Size'] = max([n for n,_ in self.xref]+list(self.xrefCompressed)+[-1])+1
+        self.seek(saved)
+        return self.xref
+    
+    def readXrefSection(self,offset,seen):
+        # one xref section at offset: classic 'xref' table and its trailer dictionary, or a
+        # cross-reference stream (7.5.8). returns the trailer
+        self.seek(offset)
+        token = self.nextToken()
+        if token and token.type == NUM_INT:       # 'N G obj' -> xref stream, its dict is the trailer
+            return self.readXrefStream(offset,seen)
+        if not token or token.type != XREF_BEGIN:
+            print(f'no xref table at byte {offset}')
+            return None
+        freed = set()
+        while True:
+            token = self.nextToken()
+            if not token:
+                return None
+            if token.type == TRAILER:
+                break
+            second = self.nextToken()                           # subsection header 'start count'
+            if token.type != NUM_INT or not second or second.type != NUM_INT:
+                print(f'bad xref subsection header at byte {token.pos}')
+                return None
+            start,count = token.data,second.data
+            p = self.tell()
+            objnum = start
+            for _,m in zip(range(count),RE_XREF_ENTRY.finditer(self.data,p)):  # entries are parsed straight off the buffer,
+                if objnum not in seen:                                         # 3 tokens per entry is too slow for big tables
+                    seen.add(objnum)
+                    if m[3] == b'n':
+                        self.xref[(objnum,int(m[2]))] = int(m[1])
+                    else:
+                        freed.add(objnum)
+                objnum += 1
+                p = m.end()
+            self.seek(p)
+        token = self.nextToken()
+        if not token or token.type != DICT_BEGIN:
+            print(f'no trailer dictionary after xref at byte {offset}')
+            return None
+        trailer = self.readObjectData()
+        if b'XRefStm' in trailer:   # hybrid file (7.5.8.4): the xref stream lists the compressed objects this table leaves free
+            hidden = seen - freed
+            self.readXrefStream(trailer[b'XRefStm'],hidden)
+            seen |= hidden
+        return trailer
+    
+    def readXrefStream(self,offset,seen):
+        # cross-reference stream object at offset. rows of /W byte widths: type, field 2, field 3.
+        # type 1 = (offset, gen), type 2 = (object stream number, index in stream), type 0 = free
+        read = self.readObjectAt(offset)
+        if read is None or len(read[1])<2 or read[1][0].get(b'Type') != b'XRef':
+            print(f'no xref stream at byte {offset}')
+            return None
+        streamDict = read[1][0]
+        data = decodeStream(streamDict,self.streamBytes(read[1][1]))
+        if data is None:
+            return None
+        widths = streamDict.get(b'W')
+        index = streamDict.get(b'Index',[0,streamDict.get(b'Size')])
+        if not (isinstance(widths,list) and len(widths) == 3 and isinstance(index,list) and len(index)%2 == 0
+                and all(type(n) is int and n >= 0 for n in widths+index)):
+            print(f'bad /W or /Index in xref stream at byte {offset}')
+            return None
+        w1,w2,w3 = widths
+        row = w1+w2+w3
+        p = 0
+        for start,count in zip(index[::2],index[1::2]):
+            for objnum in range(start,start+count):
+                if objnum not in seen:
+                    seen.add(objnum)
+                    kind = int.from_bytes(data[p:p+w1],'big') if w1 else 1    # type defaults to 1 when its width is 0
+                    f2 = int.from_bytes(data[p+w1:p+w1+w2],'big')
+                    f3 = int.from_bytes(data[p+w1+w2:p+row],'big')
+                    if kind == 1:
+                        self.xref[(objnum,f3)] = f2
+                    elif kind == 2:
+                        self.xrefCompressed[objnum] = (f2,f3)
+                p += row
+        return streamDict
+    
+    def readValue(self):
+        # one complete value at the tokenizer position: scalar, dict, array or 'N G R' reference.
+        # objects inside object streams are bare values without 'obj'/'endobj' around them
+        token = self.nextToken()
+        if not token:
+            return None
+        if token.type in [DICT_BEGIN,ARR_BEGIN]:
+            return self.readObjectData()
+        if token.type == NUM_INT:                  # look ahead for a reference
+            saved = self.tell()
+            t2,t3 = self.nextToken(),self.nextToken()
+            if t2 and t3 and t2.type == NUM_INT and t3.type == OBJ_REF:
+                return self.newRef(token.data,t2.data)
+            self.seek(saved)
+        return token.data
+    
+    def loadObjStm(self,stmnum,stm=None):
+        # decode object stream stmnum and read its header of N 'objNum offset' pairs. kept in a small LRU
+        # so every sibling in the same stream reuses the decoded buffer. stm: the object if the caller has it
+        if stm is None:
+            stm = self.get_object(stmnum)
+        if not stm or len(stm)<2 or stm[0].get(b'Type') != b'ObjStm':
+            print(f'object stream {stmnum} not found')
+            return None
+        streamDict = stm[0]
+        data = decodeStream(streamDict,self.streamBytes(stm[1]))
+        if data is None:
+            return None
+        first,count = streamDict.get(b'First'),streamDict.get(b'N')
+        if type(first) is not int or type(count) is not int or not 0 <= first <= len(data) or count < 0:
+            print(f'bad /First or /N in object stream {stmnum}')
+            return None
+        sub = PdfInterpreter(None,fast=True,data=data,compact=self.compact)
+        sub.end = first              # the header is the part before /First
+        header = []
+        for _ in range(2*count):
+            token = sub.nextToken()
+            if not token or token.type != NUM_INT:
+                print(f'object stream {stmnum} header has fewer than /N {count} entries')
+                return None
+            header.append(token.data)
+        sub.end = len(data)
+        offsets = [(objnum,first+off) for objnum,off in zip(header[::2],header[1::2])]
+        self.objStreams[stmnum] = (sub,offsets)
+        if len(self.objStreams) > self.OBJSTM_CACHE:
+            self.objStreams.popitem(last=False)
+        return sub,offsets
+    
+    def iterObjStm(self,stmnum,stm,retain=False):
+        # the objects stored in object stream stmnum (object data stm), as iter_objects tuples. they have no
+        # header of their own in the file, so the offset is None. generation is always 0 (7.5.7)
+        objstm = self.loadObjStm(stmnum,stm)
+        if objstm is None:
+            return
+        sub,offsets = objstm
+        for objnum,offset in offsets:
+            sub.seek(offset)
+            data = [sub.readValue()]
+            if retain:
+                self.objects[(objnum,0)] = data
+            yield objnum,0,data,None
+    
+    def readCompressed(self,objnum):
+        # object objnum from its object stream, same format as self.objects values ([value])
+        stmnum,index = self.xrefCompressed[objnum]
+        objstm = self.objStreams.get(stmnum)
+        if objstm is None:
+            objstm = self.loadObjStm(stmnum)
+            if objstm is None:
+                return None
+        else:
+            self.objStreams.move_to_end(stmnum)
+        sub,offsets = objstm
+        if index >= len(offsets) or offsets[index][0] != objnum:    # bad index, look the number up in the header
+            index = next((k for k,(n,_) in enumerate(offsets) if n == objnum),None)
+            if index is None:
+                print(f'object {objnum} not in object stream {stmnum}')
+                return None
+        sub.seek(offsets[index][1])
+        return [sub.readValue()]
+    
+    def readObjectAt(self,offset):
+        # parse the single 'N G obj ... endobj' at offset. returns ((objNum, genNum), data) and leaves
+        # the tokenizer where it was, so this is safe to call in the middle of a linear parse
+        saved = self.tell()
+        self.seek(offset)
+        tokens = [self.nextToken() for _ in range(3)]
+        if not all(tokens) or [t.type for t in tokens] != [NUM_INT,NUM_INT,OBJ_BEGIN]:
+            print(f'no object at byte {offset}')
+            self.seek(saved)
+            return None
+        key = (tokens[0].data,tokens[1].data)
+        data = self.readObjectData()
+        self.seek(saved)
+        return key,data
+    
+    def resolve(self,value):
+        # follow a reference (Ref or {(objNum, genNum): 'REF'}) to the value it references, anything else is
+        # returned as is
+        key = refKey(value)
+        if key is not None:
+            obj = self.get_object(*key)
+            return obj[0] if obj else None
+        return value
+    
+    def streamFilterDict(self,obj):
+        # stream dictionary of obj with indirect /Filter and /DecodeParms resolved, or None if obj has no stream
+        if not obj or len(obj)<2 or not isinstance(obj[0],dict):
+            return None
+        streamDict = obj[0]
+        if b'Filter' in streamDict or b'DecodeParms' in streamDict:
+            streamDict = dict(streamDict)
+            for key in (b'Filter',b'DecodeParms'):
+                value = self.resolve(streamDict.get(key))
+                if isinstance(value,list):
+                    value = [self.resolve(v) for v in value]
+                if value is not None:
+                    streamDict[key] = value
+        return streamDict
+    
+    def streamData(self,objnum,gennum=0):
+        # decoded data of stream object (objnum, gennum). decoded results are kept in a byte-bounded LRU
+        key = (objnum,gennum)
+        data = self.decoded.get(key)
+        if data is not None:
+            return data
+        obj = self.get_object(objnum,gennum)
+        streamDict = self.streamFilterDict(obj)
+        if streamDict is None:
+            return None
+        data = decodeStream(streamDict,self.streamBytes(obj[1]))
+        if data is not None:
+            self.decoded.put(key,data)
+        return data
+    
+    def iterStreamData(self,objnum,gennum=0,chunk=DECODE_CHUNK):
+        # decoded data of stream object (objnum, gennum) as chunks. for streams too big to decode in one go,
+        # never cached. yields the cached copy if streamData already decoded it
+        data = self.decoded.get((objnum,gennum))
+        if data is not None:
+            yield from iterChunks(data,chunk)
+            return
+        obj = self.get_object(objnum,gennum)
+        streamDict = self.streamFilterDict(obj)
+        if streamDict is not None:
+            yield from iterDecode(streamDict,self.streamBytes(obj[1]),chunk)
+    
+    def get_object(self,objnum,gennum=0):
+        # object data by number, same format as self.objects values. seeks straight to the offset from the
+        # xref table and parses only that object. None if the object is not in the file (spec: treat as null)
+        key = (objnum,gennum)
+        if key in self.objects:
+            return self.objects[key]
+        cache = self.cache
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        offset = self.loadXref().get(key)
+        if offset is not None:
+            read = self.readObjectAt(offset)
+            if read is None or read[0] != key:
+                if read is not None:
+                    print(f'xref for {key} points to object {read[0]} at byte {offset}')
+                if self.recover and not self.recovered:    # the xref looked fine but isn't, rebuild and retry
+                    self.rebuildXref()
+                    return self.get_object(objnum,gennum)
+                return None
+            data = read[1]
+        elif gennum == 0 and objnum in self.xrefCompressed:
+            data = self.readCompressed(objnum)
+            if data is None:
+                return None
+        else:
+            return None
+        cache[key] = data
+        if len(cache) > self.cacheSize:
+            cache.popitem(last=False)
+        return data
+    
+    
+    ##############################################
+    # lazy document model. values with ObjectRef proxies instead of reference placeholders, resolved on first
+    # use. page_count/get_page only load the page tree nodes on the way from /Root to the page. text
+    # extraction (iterText) runs the content lexer (iterContent) over each page as it is reached
+    
+    def ref(self,objnum,gennum=0):
+        # the (shared) ObjectRef for an object
+        key = (objnum,gennum)
+        ref = self.refs.get(key)
+        if ref is None:
+            ref = self.refs[key] = ObjectRef(self,objnum,gennum)
+        return ref
+    
+    def lazyValue(self,value):
+        # copy of value with every reference (either form) replaced by its ObjectRef. references
+        # are not followed, so this is bounded by the value itself, and it walks with an explicit stack like
+        # readObjectData so deep nesting is fine
+        if isRef(value):
+            return self.ref(*refKey(value))
+        if not isinstance(value,(dict,list)):
+            return value
+        out = {} if isinstance(value,dict) else []
+        todo = [(value,out)]
+        while todo:
+            src,dst = todo.pop()
+            for k,v in (src.items() if isinstance(src,dict) else enumerate(src)):
+                if isRef(v):
+                    v = self.ref(*refKey(v))
+                elif isinstance(v,(dict,list)):
+                    todo.append((v,{} if isinstance(v,dict) else []))
+                    v = todo[-1][1]
+                if isinstance(dst,dict):
+                    dst[k] = v
+                else:
+                    dst.append(v)
+        return out
+    
+    def lazyObject(self,objnum,gennum=0):
+        # value of an object for the lazy model: the stream dictionary for streams (ObjectRef.stream() has the
+        # data), the object's value otherwise, None if it is missing
+        obj = self.get_object(objnum,gennum)
+        if not obj:
+            return None
+        return self.lazyValue(obj[0])
+    
+    def catalog(self):
+        # the document catalog (/Root of the trailer) as a lazy dict, None without one
+        self.loadXref()
+        root = self.lazyValue(self.trailer.get(b'Root'))
+        if isinstance(root,ObjectRef):
+            root = root.value
+        if not isinstance(root,dict):
+            print('no /Root catalog in trailer')
+            return None
+        return root
+    
+    def walk(self,value,seen=None):
+        # depth first generator over value and everything reachable from it through references, every
+        # referenced object is visited once (cycle safe). yields (ObjectRef or None for the start, value)
+        seen = set() if seen is None else seen
+        todo = [(None,value)]
+        while todo:
+            ref,value = todo.pop()
+            yield ref,value
+            children = value.values() if isinstance(value,dict) else value if isinstance(value,list) else ()
+            for v in reversed(list(children)):
+                if isinstance(v,ObjectRef):
+                    if v.key not in seen:
+                        seen.add(v.key)
+                        todo.append((v,v.value))
+                elif isinstance(v,(dict,list)):
+                    todo.append((None,v))
+    
+    def pagesRoot(self):
+        root = self.catalog()
+        pages = root.get(b'Pages') if root else None
+        return pages.value if isinstance(pages,ObjectRef) else pages
+    
+    def nodeCount(self,node,seen):
+        # page count of a page tree node: /Count, or counted through the kids if that is missing/broken
+        count = node.get(b'Count')
+        if isinstance(count,ObjectRef):
+            count = count.value
+        if isinstance(count,int) and count >= 0:
+            return count
+        count = 0
+        for kid in self.lazyKids(node):
+            if isinstance(kid,ObjectRef) and kid.key not in seen:
+                kidNode = kid.value
+                if isinstance(kidNode,dict):
+                    isNode = b'Kids' in kidNode and kidNode.get(b'Type') != b'Page'
+                    count += self.nodeCount(kidNode,seen|{kid.key}) if isNode else 1
+        return count
+    
+    def page_count(self):
+        # number of pages, from the /Count of the page tree root
+        pages = self.pagesRoot()
+        return self.nodeCount(pages,set()) if isinstance(pages,dict) else 0
+    
+    def get_page(self,i):
+        # page dictionary of page i (0 based). descends from the root by /Count, loading only the nodes on the
+        # path and the kids in front of it. IndexError if out of range, None if the page tree is broken
+        count = self.page_count()
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError(f'page {i} out of range, document has {count} pages')
+        node = self.pagesRoot()
+        seen = set()
+        while True:
+            for kid in self.lazyKids(node):
+                if not isinstance(kid,ObjectRef) or kid.key in seen:
+                    continue
+                kidNode = kid.value
+                if not isinstance(kidNode,dict):
+                    continue
+                if b'Kids' in kidNode and kidNode.get(b'Type') != b'Page':     # intermediate /Pages node
+                    n = self.nodeCount(kidNode,seen|{kid.key})
+                    if i < n:
+                        seen.add(kid.key)
+                        node = kidNode
+                        break
+                    i -= n
+                elif i == 0:
+                    return kidNode
+                else:
+                    i -= 1
+            else:
+                print(f'page tree ended before page {i}, /Count does not match the kids')
+                return None
+    
+    def pageAttribute(self,page,key):
+        # page attribute, inherited from the /Parent chain if the page doesn't set it (Resources, MediaBox,
+        # CropBox, Rotate, 7.7.3.4)
+        seen = set()
+        while isinstance(page,dict):
+            if key in page:
+                value = page[key]
+                return value.value if isinstance(value,ObjectRef) else value
+            parent = page.get(b'Parent')
+            if not isinstance(parent,ObjectRef) or parent.key in seen:
+                return None
+            seen.add(parent.key)
+            page = parent.value
+        return None
+    
+    def iterPages(self):
+        # page dictionaries in document order. walks the page tree with an explicit stack, every node once
+        pages = self.pagesRoot()
+        if not isinstance(pages,dict):
+            return
+        seen = set()
+        todo = [iter(self.lazyKids(pages))]
+        while todo:
+            try:
+                kid = next(todo[-1])
+            except StopIteration:
+                todo.pop()
+                continue
+            if not isinstance(kid,ObjectRef) or kid.key in seen:
+                continue
+            seen.add(kid.key)
+            node = kid.value
+            if not isinstance(node,dict):
+                continue
+            if b'Kids' in node and node.get(b'Type') != b'Page':
+                todo.append(iter(self.lazyKids(node)))
+            else:
+                yield node
+    
+    def lazyKids(self,node):
+        # /Kids of a page tree node as a list, [] when missing or a dangling reference (null, 7.3.10)
+        kids = node.get(b'Kids')
+        if isinstance(kids,ObjectRef):
+            kids = kids.value
+        return kids if isinstance(kids,list) else []
+    
+    def pageContent(self,page):
+        # decoded content of a page, the streams of a /Contents array joined by newlines (7.8.2)
+        contents = page.get(b'Contents')
+        if isinstance(contents,ObjectRef) and isinstance(contents.value,list):
+            contents = contents.value
+        refs = contents if isinstance(contents,list) else [contents]
+        return b'\n'.join([data for data in (ref.stream() for ref in refs if isinstance(ref,ObjectRef)) if data])
+    
+    def fontDecoder(self,font):
+        # font codes -> text for a font dictionary: its ToUnicode CMap, falling back to the encoding for codes
+        # the map leaves out (latin-1 for simple fonts, cidDecoder for Type0). decoders of indirect fonts are
+        # cached per interpreter
+        key = font.key if isinstance(font,ObjectRef) else None
+        decode = self.fonts.get(key)
+        if decode is not None:
+            return decode
+        fontDict = font.value if isinstance(font,ObjectRef) else font
+        if isinstance(fontDict,dict):
+            toUnicode = fontDict.get(b'ToUnicode')
+            data = toUnicode.stream() if isinstance(toUnicode,ObjectRef) else None
+            fallback = latin1
+            if fontDict.get(b'Subtype') == b'Type0':
+                fallback = cidDecoder(fontDict.get(b'Encoding'))
+            decode = cmapDecoder(*parseToUnicode(data),fallback) if data else fallback
+        if decode is None:
+            decode = latin1
+        if key is not None:
+            self.fonts[key] = decode
+        return decode
+    
+    def contentText(self,data,resources,seen):
+        # text of a content stream in content order: new lines for line moves and text blocks, a space for wide
+        # TJ gaps. no layout analysis beyond that. form XObjects (Do) are followed, each once
+        out = []
+        def newline():
+            if out and not out[-1].endswith('\n'):
+                out.append('\n')
+        def lookup(name):
+            d = resources.get(name) if isinstance(resources,dict) else None
+            return d.value if isinstance(d,ObjectRef) else d
+        fonts = lookup(b'Font')
+        decoders = {}        # font resource name -> decoder, Tf comes before nearly every text run
+        decode = latin1
+        y = None
+        for operands,op in iterContent(data):
+            if op not in TEXT_OPERATORS:     # paths, colors, graphics state: most of a typical page
+                continue
+            if op == b'TJ':
+                for item in operands[0] if operands and isinstance(operands[0],list) else ():
+                    if isinstance(item,(bytes,memoryview)):
+                        out.append(decode(stringBytes(item)))
+                    elif isinstance(item,(int,float)) and item < -200:   # thousandths of text space, word sized gap
+                        out.append(' ')
+            elif op == b'Tf':
+                name = operands[0] if operands and isinstance(operands[0],bytes) else None
+                decode = decoders.get(name)
+                if decode is None:
+                    font = fonts.get(name) if isinstance(fonts,dict) else None
+                    decode = decoders[name] = self.fontDecoder(font) if font is not None else latin1
+            elif op == b'Tj' or op == b"'" or op == b'"':
+                if op != b'Tj':
+                    newline()
+                if operands and isinstance(operands[-1],(bytes,memoryview)):
+                    out.append(decode(stringBytes(operands[-1])))
+            elif op == b'Td' or op == b'TD':
+                if len(operands) == 2 and operands[1] != 0:
+                    newline()
+            elif op == b'T*' or op == b'ET':
+                newline()
+            elif op == b'Tm':
+                if len(operands) == 6:
+                    if y is not None and operands[5] != y:
+                        newline()
+                    y = operands[5]
+            elif op == b'Do' and operands:
+                xobjects = lookup(b'XObject')
+                ref = xobjects.get(operands[0]) if isinstance(xobjects,dict) else None
+                if isinstance(ref,ObjectRef) and ref.key not in seen:
+                    seen.add(ref.key)
+                    form = ref.value
+                    if isinstance(form,dict) and form.get(b'Subtype') == b'Form':
+                        formResources = form.get(b'Resources')
+                        if isinstance(formResources,ObjectRef):
+                            formResources = formResources.value
+                        newline()
+                        out.append(self.contentText(ref.stream() or b'',formResources or resources,seen))
+                        newline()
+        return ''.join(out)
+    
+    def pageText(self,page):
+        # extracted text of one page dictionary (see contentText)
+        return self.contentText(self.pageContent(page),self.pageAttribute(page,b'Resources'),set())
+    
+    def iterText(self):
+        # generator of the text of every page in order, one string per page. pages are loaded as they come
+        for page in self.iterPages():
+            yield self.pageText(page)
+    
+    
+    ##############################################
+    # persistent index, see indexPath. loadIndex on an unchanged file replaces loadXref
+    
+    def buildIndex(self):
+        # fill the index tables from the xref: stream spans by parsing every object once (in file order) with
+        # stream bodies left unread
+        self.loadXref()
+        offsets = sorted((offset,key) for key,offset in self.xref.items())
+        bodies,self.streamBodies = self.streamBodies,False
+        spans = {}
+        for offset,key in offsets:
+            read = self.readObjectAt(offset)
+            if read and len(read[1])==2 and isinstance(read[1][1],StreamSpan):
+                spans[key] = read[1][1]
+        self.streamBodies = bodies
+        self.streamLengths = {span.offset:span.length for span in spans.values()}
+        self.indexSpans = spans
+    
+    def saveIndex(self):
+        # write the index next to/for the file. written to a temp file of its own and renamed, readers never see
+        # half an index and concurrent writers don't share one. the index is only a cache: a directory that can't
+        # be written to is reported and the file stays open without it. returns True if it was written
+        size,mtime,digest = fileFingerprint(self.filename,self.data)
+        objects = [(objnum,gennum,1,offset,0) for (objnum,gennum),offset in self.xref.items()]
+        objects += [(objnum,0,2,stmnum,index) for objnum,(stmnum,index) in self.xrefCompressed.items()]
+        objects += [(objnum,0,0,0,0) for objnum in self.xrefFree]
+        streams = [(objnum,gennum,span.offset,span.length) for (objnum,gennum),span in self.indexSpans.items()]
+        trailer = pdfBytes(self.trailer)
+        tmp = None
+        try:
+            fd,tmp = tempfile.mkstemp(suffix='.tmp',prefix=os.path.basename(self.indexPath)+'.',
+                                      dir=os.path.dirname(self.indexPath) or None)
+            with os.fdopen(fd,'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC,size,mtime,digest,len(objects),len(streams),len(trailer)))
+                for rows,columns in ((objects,INDEX_OBJECT_COLUMNS),(streams,INDEX_STREAM_COLUMNS)):
+                    for k,(code,_) in enumerate(columns):
+                        f.write(array(code,[row[k] for row in rows]).tobytes())
+                f.write(trailer)
+            os.replace(tmp,self.indexPath)
+        except OSError as e:
+            print(f'cannot write index {self.indexPath}: {e}')
+            if tmp is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp)
+            return False
+        return True
+    
+    def loadIndex(self):
+        # load xref, object/stream spans and trailer from the index. False if there is none or it is stale
+        # (magic/byte order, size, mtime or content hash differ), the caller then rebuilds it
+        try:
+            with open(self.indexPath,'rb') as f:
+                index = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        except (OSError,ValueError):      # missing, or empty file (can't be mapped)
+            return False
+        with index:
+            if len(index) < INDEX_HEADER.size:
+                return False
+            magic,size,mtime,digest,nobjects,nstreams,ntrailer = INDEX_HEADER.unpack_from(index)
+            if magic != INDEX_MAGIC or (size,mtime,digest) != fileFingerprint(self.filename,self.data):
+                return False
+            view = memoryview(index)
+            p = INDEX_HEADER.size
+            columns = []
+            for count,layout in ((nobjects,INDEX_OBJECT_COLUMNS),(nstreams,INDEX_STREAM_COLUMNS)):
+                for code,width in layout:
+                    column = array(code)
+                    column.frombytes(view[p:p+count*width])
+                    columns.append(column)
+                    p += count*width
+            trailer = bytes(view[p:p+ntrailer])
+            view.release()
+        objnums,gennums,kinds,a,b,snums,sgens,soffsets,slengths = columns
+        for objnum,gennum,kind,x,y in zip(objnums,gennums,kinds,a,b):
+            if kind == 1:
+                self.xref[(objnum,gennum)] = x
+            elif kind == 2:
+                self.xrefCompressed[objnum] = (x,y)
+            else:
+                self.xrefFree.add(objnum)
+        self.indexSpans = {(objnum,gennum):StreamSpan(offset,length) for objnum,gennum,offset,length in zip(snums,sgens,soffsets,slengths)}
+        self.streamLengths = dict(zip(soffsets,slengths))
+        self.trailer = PdfInterpreter(None,fast=True,data=trailer,compact=self.compact).readValue() if trailer else {}
+        self.xrefLoaded = True
+        return True
+    
+    
+    ##############################################
+    # writing. writePdf serializes the whole object model, writeIncremental appends only what changed
+    
+    def setObject(self,objnum,gennum,data):
+        # replace (or add) object data in self.objects and mark it for the next writeIncremental. data is in the
+        # form of self.objects, literal strings as raw token bytes: pass new text through escapeString
+        key = (objnum,gennum)
+        self.objects[key] = data
+        self.cache.pop(key,None)
+        self.modified.add(key)
+        self.unappended.add(key)
+        self.digests.pop(key,None)
+        self.decoded.pop(key)
+        self.fonts.pop(key,None)
+        if key in self.refs:
+            self.refs[key].reset()
+        return key
+    
+    def addObject(self,data):
+        # new object under the next free object number, returns its key
+        objnum = max([n for n,_ in self.loadXref()] + list(self.xrefCompressed) + [n for n,_ in self.objects] + [0]) + 1
+        objnum = max(objnum,self.trailer.get(b'Size',0))
+        return self.setObject(objnum,0,data)
+    
+    def newTrailer(self,size):
+        # trailer for a written xref section: the file's trailer without the keys that describe the old xref
+        self.loadXref()
+        trailer = {k:v for k,v in self.trailer.items() if k not in XREF_ONLY_KEYS}
+        if b'Root' not in trailer:           # no trailer in the file, point at the catalog if we have one
+            for (objnum,gennum),data in self.objects.items():
+                if data and isinstance(data[0],dict) and data[0].get(b'Type') == b'Catalog':
+                    trailer[b'Root'] = self.newRef(objnum,gennum)
+                    break
+        trailer[b'Size'] = max(size,trailer.get(b'Size',0))
+        return trailer
+    
+    def writableObjects(self):
+        # (key, data) of every object for a complete rewrite: self.objects, and the objects of the file it doesn't
+        # hold (not parsed, or only some edited with setObject) loaded through the xref with get_object. members
+        # of object streams come out as regular objects, the object streams and xref streams themselves are
+        # dropped (a classic xref can't point into them). objects the xref marks free are left out unless they
+        # were set again with setObject. after optimize self.objects is the whole document, the xref is not used
+        self.loadXref()
+        keys = list(self.objects)
+        if not self.wholeDocument:
+            inFile = list(self.xref) + [(objnum,0) for objnum in self.xrefCompressed]
+            keys += [key for key in inFile if key not in self.objects]
+        for key in keys:
+            if key[0] in self.xrefFree and key not in self.modified:
+                continue
+            data = self.get_object(*key)
+            if not data:
+                continue
+            kind = data[0].get(b'Type') if len(data)==2 and isinstance(data[0],dict) else None
+            if kind == b'XRef' or kind == b'ObjStm':
+                continue
+            yield key,data
+    
+    def optimize(self,dedupe=True,collect=True):
+        # shrink self.objects before writePdf: merge identical objects (dedupe) and drop objects nothing reaches
+        # from the trailer's /Root, /Info and /Encrypt (collect). the table is the writePdf view of the document
+        # (every object of the xref with the edits in self.objects on top, object stream members as regular
+        # objects, xref/object streams dropped), a file without any xref is parsed linearly first.
+        # duplicates are found by content digest, references to them are rewritten to the
+        # copy with the lowest number, repeated until nothing changes, so e.g. fonts that only differed by which
+        # (identical) font file they pointed at merge in the second round. only resources are merged (see
+        # shareable), annotations, form fields, outline items etc. have an identity. returns counts
+        if not self.wholeDocument and not self.loadXref() and not self.xrefCompressed:
+            self.seek(0)
+            for _ in self.iter_objects(retain=True):
+                pass
+        table = dict(self.writableObjects())
+        before = len(table)
+        trailer = self.newTrailer(0)
+        duplicates = 0
+        if dedupe and b'Encrypt' in trailer:     # ciphertext depends on the object number, equal bytes aren't equal objects
+            print('encrypted document, skipping dedupe')
+            dedupe = False
+        while dedupe:
+            first = {}       # digest -> key of the copy that stays
+            merged = {}      # key -> key it is merged into, this round
+            for key in sorted(table):
+                data = table[key]
+                if not self.shareable(data):
+                    continue
+                kept = first.setdefault(self.objectDigest(key,data),key)
+                if kept != key:
+                    merged[key] = kept
+            if not merged:
+                break
+            duplicates += len(merged)
+            for key in merged:
+                del table[key]
+            for key,data in table.items():
+                if self.rewriteRefs(data,merged):
+                    self.modified.add(key)
+                    self.unappended.add(key)
+            self.rewriteRefs(trailer,merged)
+            self.rewriteRefs(self.trailer,merged)
+        unreachable = 0
+        if collect:
+            if b'Root' in trailer:
+                live = self.reachable(table,[trailer.get(k) for k in (b'Root',b'Info',b'Encrypt')])
+                unreachable = len(table)-len(live)
+                table = {key:data for key,data in table.items() if key in live}
+            else:
+                print('no /Root to collect from, keeping all objects')
+        self.objects = table
+        self.wholeDocument = True        # the table is the whole document now, nothing in it is free
+        self.xrefFree = set()
+        self.cache.clear()
+        for ref in self.refs.values():
+            ref.reset()
+        return {'objects':before,'duplicates':duplicates,'unreachable':unreachable,'kept':len(table)}
+    
+    def shareable(self,data):
+        # True for objects that may be referenced from several places, so identical copies can be merged:
+        # streams (content, images, forms, font files, ICC profiles...), resource dictionaries by /Type and
+        # color space arrays. everything else (annotations, fields, outlines, structure elements, page tree)
+        # is left alone, the spec ties those to one parent
+        value = data[0]
+        if len(data) == 2 and isinstance(value,dict):
+            return True
+        if isinstance(value,dict):
+            return value.get(b'Type') in SHAREABLE_TYPES
+        if isinstance(value,list):
+            return bool(value) and value[0] in COLOR_SPACE_FAMILIES
+        return False
+    
+    def objectDigest(self,key,data):
+        # content digest of an object body. streams: the dictionary without /Length (the writer sets it) plus a
+        # digest of the raw encoded bytes, which is computed once per object and kept in self.digests
+        if len(data) == 2 and isinstance(data[0],dict):
+            raw = self.digests.get(key)
+            if raw is None:
+                raw = self.digests[key] = hashlib.blake2b(self.streamBytes(data[1]),digest_size=16).digest()
+            streamDict = {k:v for k,v in data[0].items() if k != b'Length'}
+            return hashlib.blake2b(pdfBytes(streamDict)+b'stream'+raw,digest_size=16).digest()
+        return hashlib.blake2b(b' '.join(pdfBytes(v) for v in data),digest_size=16).digest()
+    
+    def rewriteRefs(self,value,remap):
+        # point references to remap keys at remap[key] instead, in place through all containers in value.
+        # True if anything was rewritten
+        changed = False
+        newRef = self.newRef
+        todo = [value]
+        while todo:
+            container = todo.pop()
+            for k,v in (container.items() if isinstance(container,dict) else enumerate(container)):
+                key = refKey(v)
+                if key is not None:
+                    target = remap.get(key)
+                    if target is not None:
+                        container[k] = newRef(*target)
+                        changed = True
+                elif isinstance(v,(dict,list)):
+                    todo.append(v)
+        return changed
+    
+    def reachable(self,table,roots):
+        # keys of table reachable from the values in roots, following references (explicit stack, each object once)
+        live = set()
+        todo = [v for v in roots if v is not None]
+        while todo:
+            v = todo.pop()
+            key = refKey(v)
+            if key is not None:
+                if key not in live and key in table:
+                    live.add(key)
+                    todo.extend(table[key])
+            elif isinstance(v,dict):
+                todo.extend(v.values())
+            elif isinstance(v,list):
+                todo.extend(v)
+        return live
+    
+    def writePdf(self,filename,bufferSize=1<<20):
+        # write self.objects as a complete new PDF: header, objects in number order, xref table, trailer.
+        # goes through a buffered file, stream data is written straight from the input (no copies for mmap/spans)
+        header = bytes(self.data[:8]) if self.data[:5] == b'%PDF-' else b'%PDF-1.7'
+        with open(filename,'wb',buffering=bufferSize) as f:
+            w = PdfWriter(f)
+            w.write(header + b'\n%\xe2\xe3\xcf\xd3\n')       # binary comment so transfer tools treat the file as binary
+            for (objnum,gennum),data in sorted(self.writableObjects()):
+                w.writeObject(objnum,gennum,data,self)
+            size = max(w.xref)+1 if w.xref else 1
+            w.writeXref(self.newTrailer(size),full=True)
+        return w.offset
+    
+    def writeIncremental(self,filename=None,bufferSize=1<<16):
+        # incremental update (7.5.6): append the objects changed with setObject/addObject and a new xref
+        # section whose trailer has /Prev pointing at the previous xref. returns the bytes appended.
+        # filename None appends to the input file in place. self.data still is the file as opened, so the
+        # size/startxref/Size of the last in-place append are kept in self.appended and the next one chains
+        # onto it with only the objects changed since. with a filename the original bytes are copied there
+        # and everything changed since opening goes into one update, so repeated calls never lose edits
+        trailer = self.newTrailer(0)
+        if filename is None:
+            keys = self.unappended
+            size,prev,lastSize = self.appended or (len(self.data),self.findStartXref(),0)
+        else:
+            keys = self.modified
+            size,prev,lastSize = len(self.data),self.findStartXref(),0
+        mode = 'ab' if filename is None else 'wb'
+        with open(self.filename if filename is None else filename,mode,buffering=bufferSize) as f:
+            if filename is not None:
+                view = memoryview(self.data)
+                for p in range(0,size,bufferSize):
+                    f.write(view[p:p+bufferSize])
+            w = PdfWriter(f,size)
+            if size == len(self.data) and size and self.data[size-1] not in self.CHAR_EOL:
+                w.write(b'\n')       # after an earlier append the file ends with the '%%EOF\n' we wrote
+            for key in sorted(keys):
+                w.writeObject(key[0],key[1],self.objects[key],self)
+            if prev is not None:
+                trailer[b'Prev'] = prev
+            trailer[b'Size'] = max(trailer[b'Size'],lastSize,max(w.xref)+1 if w.xref else 0)
+            start = w.writeXref(trailer,full=False)
+        if filename is None:
+            self.appended = (w.offset,start,trailer[b'Size'])
+            self.unappended.clear()
+        return w.offset-size
             
 
         
     
 ##############################################################
+# command line. importing the module does nothing, parsing only happens through main()
+#
+#   python parse_pdf_source.py parse file.pdf [--legacy]        parse one file, print objects and MB/s
+#   python parse_pdf_source.py batch DIR_OR_FILES... -j 8       parse many files in a process pool, JSON lines out
 
+def parseFile(filename,options):
+    # batch worker: parse one file, return a json-able result. the parser reports problems with print(),
+    # those are captured here (stdout is the JSON lines stream) and returned as 'messages'
+    result = {'file':filename,'objects':0,'bytes':0,'seconds':0.0,'mb_s':0.0,'error':None}
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            with PdfInterpreter(filename,fast=not options.get('legacy'),useMmap=not options.get('legacy'),
+                                streamBodies=False) as interp:
+                result['bytes'] = len(interp.data)
+                result['objects'] = sum(1 for _ in interp.iter_objects())
+                if not result['objects'] and interp.data.find(b'%PDF-',0,1024) < 0:   # header may sit behind junk (7.5.2)
+                    interp.loadXref()
+                    if b'Root' not in interp.trailer:
+                        result['error'] = 'not a PDF: no %PDF- header, no objects or catalog found'
+                if options.get('pages') and result['error'] is None:
+                    result['pages'] = interp.page_count()
+    except Exception as e:       # one broken file must not take the batch down
+        result['error'] = f'{type(e).__name__}: {e}'
+    seconds = time.perf_counter()-start
+    result['seconds'] = round(seconds,6)
+    result['mb_s'] = round(result['bytes']/(1024*1024)/seconds,3) if seconds > 0 else 0.0
+    messages = log.getvalue().splitlines()
+    if messages:
+        result['messages'] = messages[:20]     # first few, a bad file can print thousands
+        result['message_count'] = len(messages)
+    return result
 
-# file = 'ISO_32000-2-2020_sponsored.pdf'
-file = 'engine_pyCopy.pdf'
+def findPdfs(paths,recursive=True):
+    # files named on the command line as is, directories searched for *.pdf (any case)
+    for path in paths:
+        if os.path.isdir(path):
+            for folder,dirs,files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith('.pdf'):
+                        yield os.path.join(folder,name)
+                if not recursive:
+                    break
+        else:
+            yield path
 
+def runBatch(files,workers=None,options=None,out=None,window=None):
+    # parse files across a process pool, write one JSON line per file to out as soon as it is done (completion
+    # order). at most `window` files are in flight, so a listing of any size never piles up in memory.
+    # returns (files, objects, bytes, errors, seconds) totals
+    out = out or sys.stdout
+    options = options or {}
+    workers = workers or os.cpu_count() or 1
+    window = window or workers*4
+    totals = [0,0,0,0]
+    start = time.perf_counter()
+    def report(result):
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        totals[0] += 1
+        totals[1] += result['objects']
+        totals[2] += result['bytes']
+        totals[3] += result['error'] is not None
+    files = iter(files)
+    if workers < 2:                   # no pool, same results
+        for filename in files:
+            report(parseFile(filename,options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for filename in files:
+                pending.add(pool.submit(parseFile,filename,options))
+                if len(pending) >= window:
+                    done,pending = wait(pending,return_when=FIRST_COMPLETED)
+                    for future in done:
+                        report(future.result())
+            for future in as_completed(pending):
+                report(future.result())
+    return (*totals,time.perf_counter()-start)
 
-interp = PdfInterpreter(file)
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='parse_pdf_source',description='PDF parser')
+    commands = parser.add_subparsers(dest='command',required=True)
+    p = commands.add_parser('parse',help='parse one file and print throughput')
+    p.add_argument('file')
+    p.add_argument('--legacy',action='store_true',help='byte-at-a-time tokenizer instead of the fast one')
+    b = commands.add_parser('batch',help='parse many files in parallel, JSON lines per file on stdout')
+    b.add_argument('paths',nargs='+',help='PDF files and/or directories (searched for *.pdf)')
+    b.add_argument('-j','--workers',type=int,default=None,help='worker processes (default: cpu count)')
+    b.add_argument('--no-recursive',action='store_true',help="don't descend into subdirectories")
+    b.add_argument('--pages',action='store_true',help='also report the page count')
+    b.add_argument('--legacy',action='store_true',help='byte-at-a-time tokenizer instead of the fast one')
+    b.add_argument('-o','--output',help='write the JSON lines here instead of stdout')
+    args = parser.parse_args(argv)
+    
+    if args.command == 'parse':
+        start = time.time()
+        interp = PdfInterpreter(args.file,fast=not args.legacy,useMmap=not args.legacy)
+        i = sum(1 for _ in interp.iter_objects(retain=True))
+        end = time.time()
+        print(f'read {i} objects in {end-start:0.1f}s, {len(interp.data)/(1024*1024)/max(end-start,1e-9):0.2f}MB/s')
+        return 0
+    
+    files = findPdfs(args.paths,recursive=not args.no_recursive)
+    options = {'pages':args.pages,'legacy':args.legacy}
+    out = open(args.output,'w') if args.output else sys.stdout
+    try:
+        nfiles,objects,size,errors,seconds = runBatch(files,args.workers,options,out)
+    finally:
+        if args.output:
+            out.close()
+    print(f'{nfiles} files, {objects} objects, {size/(1024*1024):0.1f}MB in {seconds:0.1f}s '
+          f'({size/(1024*1024)/max(seconds,1e-9):0.2f}MB/s), {errors} errors',file=sys.stderr)
+    return errors
 
-i=0
-start=time.time()
-while interp.nextObject():
-    i+=1
-    pass
-end=time.time()
-print(f'read {i+1} objects in {end-start:0.1f}s, {(interp.pos+1)/(1024*1024)/(end-start):0.2f}MB/s')
 
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)   # exit status 1 if any file in a batch failed
 
-# start=time.time()
-# i=0
-# while interp.nextToken():
-#     # i+=1
-#     # if not i%50000:
-#     #     print(f'{time.time()-start:0.1f}s, pos={interp.pos}')
-#     pass
-# # interp.tokenize()
-# end=time.time()
-# print(f'read {interp.pos+1} bytes in {end-start:0.1f}s, {(interp.pos+1)/(1024*1024)/(end-start):0.2f}MB/s')
 
- 
+# throughput/memory benchmarks live in benchmark_pdf.py (synthetic workloads, JSON results)
 
 
 # TODO
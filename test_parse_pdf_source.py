@@ -0,0 +1,767 @@
+import base64
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+import zlib
+
+import benchmark_pdf
+import parse_pdf_source as pdf
+
+
+def buildPdf(objs,trailer=b''):
+    # minimal classic-xref PDF from {objNum: body bytes}
+    out = bytearray(b'%PDF-1.7\n')
+    offsets = {}
+    for n in sorted(objs):
+        offsets[n] = len(out)
+        out += b'%d 0 obj\n' % n + objs[n] + b'\nendobj\n'
+    size = max(objs)+1
+    start = len(out)
+    out += b'xref\n0 %d\n' % size
+    for n in range(size):
+        out += b'%010d 00000 n\r\n' % offsets[n] if n in offsets else b'0000000000 65535 f\r\n'
+    out += b'trailer\n<< /Size %d /Root 1 0 R %s>>\nstartxref\n%d\n%%%%EOF\n' % (size,trailer,start)
+    return bytes(out)
+
+def objStm(members):
+    # /Type /ObjStm body holding {objNum: value bytes}
+    header = b''.join(b'%d %d ' % (n,sum(len(v)+1 for v in list(members.values())[:k])) for k,n in enumerate(members))
+    data = header + b''.join(v+b' ' for v in members.values())
+    return b'<< /Type /ObjStm /N %d /First %d /Length %d >>\nstream\n%s\nendstream' % (
+        len(members),len(header),len(data),data)
+
+def xrefStream(objnum,rows,size,trailer=b''):
+    # 'N 0 obj' xref stream with /W [1 4 2]. rows: {objNum: (type, field 2, field 3)}, one /Index
+    # subsection per object, numbers not in rows are left to older sections
+    data = zlib.compress(b''.join(bytes([kind]) + f2.to_bytes(4,'big') + f3.to_bytes(2,'big')
+                                  for _,(kind,f2,f3) in sorted(rows.items())))
+    index = b' '.join(b'%d 1' % n for n in sorted(rows))
+    return (b'%d 0 obj\n<< /Type /XRef /W [1 4 2] /Index [%s] /Size %d /Root 1 0 R /Filter /FlateDecode /Length %d %s>>\n'
+            b'stream\n%s\nendstream\nendobj\n') % (objnum,index,size,len(data),trailer,data)
+
+def lzwEncode(data,early=1):
+    # reference LZW encoder (7.4.4.2): clear code first, clear again before the table outgrows 12 bit codes
+    codes = [256]
+    table = {bytes([i]):i for i in range(256)}
+    widths = [9]
+    width = 9
+    size = 258
+    w = b''
+    for c in data:
+        wc = w + bytes([c])
+        if wc in table:
+            w = wc
+            continue
+        codes.append(table[w]); widths.append(width)
+        table[wc] = size
+        size += 1
+        if size - 1 + early >= 1<<width:
+            if width == 12:
+                codes.append(256); widths.append(width)
+                table = {bytes([i]):i for i in range(256)}
+                size,width = 258,9
+            else:
+                width += 1
+        w = bytes([c])
+    if w:
+        codes.append(table[w]); widths.append(width)
+    codes.append(257); widths.append(width)
+    bits = ''.join(format(c,'0%db' % n) for c,n in zip(codes,widths))
+    bits += '0'*(-len(bits) % 8)
+    return bytes(int(bits[k:k+8],2) for k in range(0,len(bits),8))
+
+def runLengthEncode(data):
+    # reference RunLengthDecode encoder: runs of 3+ equal bytes repeated, the rest copied in blocks of up to 128
+    out = bytearray()
+    k = 0
+    while k < len(data):
+        n = 1
+        while k+n < len(data) and n < 128 and data[k+n] == data[k]:
+            n += 1
+        if n >= 3:
+            out += bytes([257-n,data[k]])
+            k += n
+            continue
+        start = k
+        while k < len(data) and k-start < 128 and not data[k:k+3] == bytes([data[k]])*3:
+            k += 1
+        k = max(k,start+1)
+        out += bytes([k-start-1]) + data[start:k]
+    return bytes(out + b'\x80')
+
+def pngEncode(rows,bpp,ftype):
+    # reference PNG predictor encoder, every row with filter type ftype
+    out = bytearray()
+    prev = bytes(len(rows[0]))
+    for row in rows:
+        enc = bytearray([ftype])
+        for k,x in enumerate(row):
+            a = row[k-bpp] if k >= bpp else 0
+            b = prev[k]
+            c = prev[k-bpp] if k >= bpp else 0
+            if ftype == 4:
+                pa,pb,pc = abs(b-c),abs(a-c),abs(a+b-2*c)
+                pred = a if pa <= pb and pa <= pc else b if pb <= pc else c
+            else:
+                pred = (0,a,b,(a+b)>>1)[ftype]
+            enc.append((x-pred) & 255)
+        out += enc
+        prev = row
+    return bytes(out)
+
+def tiffEncode(rows,bpp):
+    # reference TIFF predictor 2 encoder, 8 bits per component
+    return b''.join(bytes((x-(row[k-bpp] if k >= bpp else 0)) & 255 for k,x in enumerate(row)) for row in rows)
+
+SIMPLE = {
+    1:b'<< /Type /Catalog /Pages 2 0 R >>',
+    2:b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+    3:b'<< /Type /Page /Parent 2 0 R >>',
+    5:b'(five)',
+    6:b'(six)',
+}
+
+
+class PdfTestCase(unittest.TestCase):
+    # temporary folder per test, write() puts a file in it (buildPdf for an {objNum: body} dict), open() also
+    # opens it in fast mode. both are cleaned up after the test
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def write(self,data,name='doc.pdf'):
+        if isinstance(data,dict):
+            data = buildPdf(data)
+        file = os.path.join(self.folder.name,name)
+        with open(file,'wb') as f:
+            f.write(data)
+        return file
+
+    def open(self,data,**options):
+        interp = pdf.PdfInterpreter(self.write(data),fast=True,**options)
+        self.addCleanup(interp.close)
+        return interp
+
+
+class TestWrite(PdfTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.file = self.write(SIMPLE)
+
+    def reopen(self,file):
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            interp = pdf.PdfInterpreter(file,fast=True,recover=False)
+            values = {n:interp.get_object(n) for n in (5,6)}
+        self.addCleanup(interp.close)
+        return values,log.getvalue(),interp
+
+    def test_two_updates_in_place(self):
+        interp = pdf.PdfInterpreter(self.file,fast=True)
+        interp.setObject(5,0,[b'five v2'])
+        interp.writeIncremental()
+        interp.setObject(6,0,[b'six v2'])
+        interp.writeIncremental()
+        interp.close()
+        values,log,reread = self.reopen(self.file)
+        self.assertEqual(values,{5:[b'five v2'],6:[b'six v2']})
+        self.assertEqual(log,'')
+        self.assertFalse(reread.recovered)
+
+    def test_two_updates_to_new_file(self):
+        interp = pdf.PdfInterpreter(self.file,fast=True)
+        self.addCleanup(interp.close)
+        out = os.path.join(self.folder.name,'out.pdf')
+        interp.setObject(5,0,[b'five v2'])
+        interp.writeIncremental(out)
+        interp.setObject(6,0,[b'six v2'])
+        interp.writeIncremental(out)
+        values,log,_ = self.reopen(out)
+        self.assertEqual(values,{5:[b'five v2'],6:[b'six v2']})
+        self.assertEqual(log,'')
+
+    def test_write_pdf(self):
+        objs = dict(SIMPLE)
+        objs[4] = b'<< /Length 5 >>\nstream\nhello\nendstream'
+        interp = self.open(objs)
+        interp.seek(0)
+        for _ in interp.iter_objects(retain=True):
+            pass
+        interp.setObject(6,0,[pdf.escapeString(b'a)b(c\\')])
+        out = os.path.join(self.folder.name,'out.pdf')
+        interp.writePdf(out)
+        values,log,reread = self.reopen(out)
+        self.assertEqual(log,'')
+        self.assertFalse(reread.recovered)
+        self.assertEqual(values[5],[b'five'])
+        self.assertEqual(pdf.unescapeString(values[6][0]),b'a)b(c\\')
+        self.assertEqual(bytes(reread.streamData(4)),b'hello')
+        self.assertEqual(reread.get_object(1)[0][b'Type'],b'Catalog')
+
+    def test_write_pdf_after_edit(self):
+        # nothing parsed but the edited object: the rest comes from the file
+        interp = self.open(SIMPLE)
+        interp.setObject(5,0,[b'five v2'])
+        out = os.path.join(self.folder.name,'out.pdf')
+        interp.writePdf(out)
+        values,log,reread = self.reopen(out)
+        self.assertEqual((values,log),({5:[b'five v2'],6:[b'six']},''))
+        self.assertEqual(reread.page_count(),1)
+
+    def test_edit_drops_decoded_data(self):
+        objs = dict(SIMPLE)
+        objs[4] = b'<< /Length 5 >>\nstream\nhello\nendstream'
+        interp = self.open(objs)
+        self.assertEqual(interp.streamData(4),b'hello')
+        self.assertEqual(interp.ref(4).stream(),b'hello')
+        interp.setObject(4,0,[{b'Length':3},b'bye'])
+        self.assertEqual(interp.streamData(4),b'bye')
+        self.assertEqual(interp.ref(4).stream(),b'bye')
+        self.assertEqual(interp.decoded.size,3)
+
+    def test_escape_string(self):
+        for text in (b'plain',b'a)b',b'((\\))',b'cr\rlf\n',bytes(range(256))):
+            self.assertEqual(pdf.unescapeString(pdf.escapeString(text)),text)
+        self.assertEqual(pdf.escapeString('\u65e5'),b'\xfe\xff\x65\xe5')
+
+
+class TestOptimize(PdfTestCase):
+
+    def optimize(self,objs):
+        interp = self.open(objs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            counts = interp.optimize()
+        return interp,counts
+
+    def test_annotations_and_fields_stay_separate(self):
+        link = b'<< /Type /Annot /Subtype /Link /Rect [0 0 10 10] /A << /S /URI /URI (http://x) >> >>'
+        widget = b'<< /Type /Annot /Subtype /Widget /FT /Tx /Rect [0 0 10 10] >>'
+        font = b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+        interp,counts = self.optimize({
+            1:b'<< /Type /Catalog /Pages 2 0 R /AcroForm << /Fields [9 0 R 10 0 R] >> >>',
+            2:b'<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>',
+            3:b'<< /Type /Page /Parent 2 0 R /Annots [7 0 R 9 0 R] /Resources << /Font << /F1 11 0 R >> >> >>',
+            4:b'<< /Type /Page /Parent 2 0 R /Annots [8 0 R 10 0 R] /Resources << /Font << /F1 12 0 R >> >> >>',
+            7:link,8:link,9:widget,10:widget,11:font,12:font,
+        })
+        self.assertEqual(counts['duplicates'],1)       # only the font
+        self.assertEqual(set(interp.objects),{(n,0) for n in (1,2,3,4,7,8,9,10,11)})
+        fields = interp.objects[(1,0)][0][b'AcroForm'][b'Fields']
+        self.assertEqual([pdf.refKey(ref) for ref in fields],[(9,0),(10,0)])
+
+
+    def test_edit_optimize_write(self):
+        # only the edited object is in self.objects, the rest of the document must survive
+        objs = dict(SIMPLE)
+        objs[1] = b'<< /Type /Catalog /Pages 2 0 R /Extra 5 0 R >>'
+        objs[7] = b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+        interp = self.open(objs)
+        interp.setObject(5,0,[b'five v2'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            counts = interp.optimize()
+        self.assertEqual(counts,{'objects':6,'duplicates':0,'unreachable':2,'kept':4})   # 6 and 7 unreferenced
+        out = os.path.join(self.folder.name,'out.pdf')
+        interp.writePdf(out)
+        with pdf.PdfInterpreter(out,fast=True,recover=False) as reread:
+            self.assertEqual(sorted(reread.loadXref()),[(1,0),(2,0),(3,0),(5,0)])
+            self.assertEqual(reread.get_object(5),[b'five v2'])
+            self.assertEqual(reread.get_page(0)[b'Type'],b'Page')
+
+
+class TestRecovery(PdfTestCase):
+
+    def objects(self,interp):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return {n:interp.get_object(n) for n in (5,6)}
+
+    def test_bad_subsection_header(self):
+        data = buildPdf(SIMPLE).replace(b'xref\n0 7',b'xref\nfoo 33')
+        interp = self.open(data)
+        self.assertEqual(self.objects(interp),{5:[b'five'],6:[b'six']})
+        self.assertTrue(interp.recovered)
+
+    def test_xref_stream_without_w(self):
+        data = buildPdf(SIMPLE)
+        start = data.index(b'xref\n')
+        body = b'7 0 obj\n<< /Type /XRef /Size 8 /Root 1 0 R /Length 0 >>\nstream\n\nendstream\nendobj\n'
+        data = data[:start] + body + b'startxref\n%d\n%%%%EOF\n' % start
+        interp = self.open(data)
+        self.assertEqual(self.objects(interp),{5:[b'five'],6:[b'six']})
+        self.assertTrue(interp.recovered)
+
+    def test_headers_inside_streams_are_ignored(self):
+        fake = b'1 0 obj (fake) endobj\n5 0 obj (fake) endobj'
+        objs = dict(SIMPLE)
+        objs[4] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(fake),fake)
+        data = buildPdf(objs).replace(b'startxref\n',b'startxref\n9')    # broken startxref
+        interp = self.open(data)
+        self.assertEqual(self.objects(interp),{5:[b'five'],6:[b'six']})
+        self.assertTrue(interp.recovered)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(interp.get_object(1)[0][b'Type'],b'Catalog')
+
+
+class TestIterObjects(PdfTestCase):
+
+    def setUp(self):
+        super().setUp()
+        members = b'(five) (six)'
+        header = b'5 0 6 7 '
+        objs = {k:v for k,v in SIMPLE.items() if k not in (5,6)}
+        objs[4] = b'<< /Type /ObjStm /N 2 /First %d /Length %d >>\nstream\n%s%s\nendstream' % (
+            len(header),len(header+members),header,members)
+        self.interp = self.open(objs)
+
+    def test_object_stream_members(self):
+        found = [(n,g,data,offset) for n,g,data,offset in self.interp.iter_objects(retain=True)]
+        self.assertEqual([(n,g) for n,g,_,_ in found],[(1,0),(2,0),(3,0),(4,0),(5,0),(6,0)])
+        self.assertEqual(found[4][2:],([b'five'],None))
+        self.assertEqual(self.interp.objects[(6,0)],[b'six'])
+
+    def test_members_off(self):
+        found = [n for n,_,_,_ in self.interp.iter_objects(members=False)]
+        self.assertEqual(found,[1,2,3,4])
+
+    def test_compact_strings_are_copies(self):
+        # a memoryview of the mapping per short string costs more than the string, compact mode copies them
+        for compact,kind in ((False,memoryview),(True,bytes)):
+            interp = pdf.PdfInterpreter(self.write(SIMPLE),fast=True,useMmap=True,compact=compact)
+            found = {n:data for n,_,data,_ in interp.iter_objects()}
+            self.assertIs(type(found[5][0]),kind)
+            self.assertEqual(bytes(found[6][0]),b'six')
+            del found
+            interp.close()
+
+    def test_malformed_numbers(self):
+        # '-', '--5', '1.2.3' read as 0 and a stray R is dropped instead of raising out of the parse
+        objs = dict(SIMPLE)
+        objs[7] = b'[R - --5 1.2.3 4. -.5 /A]'
+        interp = self.open(objs)
+        expected = [0,0,0,4,-0.5,b'A']
+        self.assertEqual(interp.get_object(7),[expected])
+        found = {n:data for n,_,data,_ in interp.iter_objects()}
+        self.assertEqual(found[7],[expected])
+
+
+class TestIndex(PdfTestCase):
+
+    def setUp(self):
+        super().setUp()
+        objs = dict(SIMPLE)
+        objs[4] = b'<< /Length 5 >>\nstream\nhello\nendstream'
+        self.file = self.write(objs)
+
+    def test_reopen_from_index(self):
+        pdf.PdfInterpreter(self.file,fast=True,index=True).close()
+        interp = pdf.PdfInterpreter(self.file,fast=True,index=True)
+        self.addCleanup(interp.close)
+        self.assertTrue(interp.xrefLoaded)
+        self.assertEqual(list(interp.indexSpans),[(4,0)])
+        self.assertEqual(bytes(interp.streamBytes(interp.get_object(4)[1])),b'hello')
+        self.assertEqual(interp.get_object(5),[b'five'])
+
+    def test_unwritable_index(self):
+        # the index is a cache: a path that can't be written is reported, the file still opens
+        os.mkdir(self.file + '.pdfidx')                   # sidecar path taken by a directory
+        blocked = self.write(b'not a directory','cache')  # cache "directory" that is a file
+        for index in (True,blocked):
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                interp = pdf.PdfInterpreter(self.file,fast=True,index=index)
+            self.addCleanup(interp.close)
+            self.assertEqual(interp.get_object(5),[b'five'])
+            self.assertIn('index',log.getvalue())
+        self.assertEqual(sorted(os.listdir(self.folder.name)),['cache','doc.pdf','doc.pdf.pdfidx'])
+
+    def test_rebuild_clears_spans(self):
+        interp = pdf.PdfInterpreter(self.file,fast=True,index=True)
+        self.addCleanup(interp.close)
+        interp.rebuildXref()
+        self.assertEqual(interp.indexSpans,{})
+        self.assertEqual(interp.streamLengths,{})
+
+
+class TestParseFile(PdfTestCase):
+
+    def test_not_a_pdf(self):
+        result = pdf.parseFile(self.write(b'hello world\nnot a pdf\n','notes.pdf'),{})
+        self.assertEqual(result['objects'],0)
+        self.assertIn('not a PDF',result['error'])
+
+    def test_pdf(self):
+        result = pdf.parseFile(self.write(SIMPLE),{'pages':True})
+        self.assertIsNone(result['error'])
+        self.assertEqual((result['objects'],result['pages']),(5,1))
+
+
+class TestText(PdfTestCase):
+
+    def test_page_text(self):
+        content = b'BT /F1 12 Tf 0 0 Td [(Hel)-10(lo)-300(world)]TJ 0 -14 Td (next) Tj ET 1 0 0 1 0 0 cm 0 0 m 9 9 l S'
+        objs = {
+            1:b'<< /Type /Catalog /Pages 2 0 R >>',
+            2:b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+            3:b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+            4:b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content),content),
+            5:b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+        }
+        interp = self.open(objs)
+        self.assertEqual(list(interp.iterText()),['Hello world\nnext\n'])
+
+    def test_one_byte_cmap(self):
+        decode = pdf.cmapDecoder({b'A':'x',b'B':'yz'},[1])
+        self.assertEqual(decode(b'ABCA'),'xyzCx')     # C is unmapped, falls back to latin-1
+
+    def test_partial_to_unicode(self):
+        # pdfTeX style map with only the ligature, the rest of the codes keep the font encoding.
+        # Type0 Identity-H without a map: CIDs aren't text
+        cmap = b'1 begincodespacerange <00> <FF> endcodespacerange 1 beginbfchar <0B> <FB00> endbfchar'
+        content = b'BT /F1 12 Tf (Ruby \\013) Tj /F2 12 Tf <00410042> Tj ET'
+        objs = {
+            1:b'<< /Type /Catalog /Pages 2 0 R >>',
+            2:b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+            3:b'<< /Type /Page /Parent 2 0 R /Contents 4 0 R /Resources << /Font << /F1 5 0 R /F2 7 0 R >> >> >>',
+            4:b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content),content),
+            5:b'<< /Type /Font /Subtype /Type1 /BaseFont /CMR10 /ToUnicode 6 0 R >>',
+            6:b'<< /Length %d >>\nstream\n%s\nendstream' % (len(cmap),cmap),
+            7:b'<< /Type /Font /Subtype /Type0 /BaseFont /MS-Mincho /Encoding /Identity-H >>',
+        }
+        interp = self.open(objs)
+        self.assertEqual(list(interp.iterText()),['Ruby \ufb00\ufffd\ufffd\n'])
+
+
+class TestFilters(unittest.TestCase):
+
+    def decode(self,streamDict,encoded):
+        # one shot and in 7 byte chunks, both have to agree
+        whole = pdf.decodeStream(streamDict,encoded)
+        self.assertEqual(b''.join(pdf.iterDecode(streamDict,encoded,7)),whole)
+        return whole
+
+    def sample(self,n=3000):
+        rnd = random.Random(n)
+        return bytes(rnd.choice(b'abcdefghij') for _ in range(n)) + bytes(rnd.randrange(256) for _ in range(n))
+
+    def test_lzw(self):
+        # example of 7.4.4.2
+        self.assertEqual(self.decode({b'Filter':b'LZWDecode'},bytes.fromhex('800b6050220c0c8501')),b'-----A---B')
+        data = self.sample()
+        for early in (0,1):
+            encoded = lzwEncode(data,early)
+            self.assertEqual(self.decode({b'Filter':b'LZWDecode',b'DecodeParms':{b'EarlyChange':early}},encoded),data)
+
+    def test_ascii(self):
+        data = self.sample(500) + bytes(8)
+        self.assertEqual(self.decode({b'Filter':b'ASCII85Decode'},base64.a85encode(data,wrapcol=60)+b'~>'),data)
+        self.assertEqual(self.decode({b'Filter':b'AHx'},data.hex(' ',3).encode()+b'>'),data)
+        self.assertEqual(self.decode({b'Filter':b'AHx'},b'4142 4>'),b'AB@')
+
+    def test_run_length(self):
+        data = self.sample(500) + bytes(300) + b'xy'*100
+        self.assertEqual(self.decode({b'Filter':b'RunLengthDecode'},runLengthEncode(data)),data)
+
+    def test_predictors(self):
+        rows = [self.sample(60)[k:k+30] for k in range(0,300,30)]
+        for ftype in range(5):
+            parms = {b'Predictor':12,b'Colors':3,b'Columns':10}
+            encoded = zlib.compress(pngEncode(rows,3,ftype))
+            self.assertEqual(self.decode({b'Filter':b'FlateDecode',b'DecodeParms':parms},encoded),b''.join(rows))
+        parms = {b'Predictor':2,b'Colors':3,b'Columns':10}
+        encoded = zlib.compress(tiffEncode(rows,3))
+        self.assertEqual(self.decode({b'Filter':b'Fl',b'DecodeParms':parms},encoded),b''.join(rows))
+
+    def test_chain(self):
+        data = b''.join([self.sample(40)[k:k+20] for k in range(0,80,20)])
+        parms = {b'Predictor':15,b'Columns':20}
+        encoded = base64.a85encode(lzwEncode(pngEncode([data[k:k+20] for k in range(0,80,20)],1,4)))+b'~>'
+        streamDict = {b'Filter':[b'A85',b'LZW'],b'DecodeParms':[None,parms]}
+        self.assertEqual(self.decode(streamDict,encoded),data)
+
+    def test_corrupt_data(self):
+        # errors are reported and end the stream, they don't propagate
+        cases = [({b'Filter':b'AHx'},b'4G41>'),
+                 ({b'Filter':b'A85'},b'abc{}~>'),
+                 ({b'Filter':b'LZW'},bytes.fromhex('8010 6580')),     # 256, 65, 300: code past the table
+                 ({b'Filter':b'Fl'},b'x\x9c\xff\xff\xff')]
+        for streamDict,encoded in cases:
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                self.assertIsInstance(self.decode(streamDict,encoded),bytes)
+            self.assertIn('error',log.getvalue())
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(pdf.decodeStream({b'Filter':b'LZW'},bytes.fromhex('8010 6580')),b'A')
+
+
+class TestParallel(PdfTestCase):
+
+    def streams(self):
+        # forward indirect /Length and 'endstream' inside the body: workers must resolve the length
+        # object in a later range instead of cutting the stream at the first 'endstream'
+        objs = dict(SIMPLE)
+        for k in range(200):
+            body = b'stream %d endstream inside the data %s' % (k,b'x'*k)
+            objs[10+2*k] = b'<< /Length %d 0 R >>\nstream\n%s\nendstream' % (11+2*k,body)
+            objs[11+2*k] = b'%d' % len(body)
+        return objs
+
+    def test_matches_serial(self):
+        objs = self.streams()
+        file = self.write(objs)
+        serial = self.open(objs)
+        for _ in serial.iter_objects(retain=True):
+            pass
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log), pdf.PdfInterpreter(file,fast=True) as interp:
+            parallel = interp.parseParallel(workers=4,minChunk=4096)
+        self.assertEqual(log.getvalue(),'')
+        self.assertEqual(parallel,serial.objects)
+        self.assertEqual(len(parallel),len(objs))
+
+    def test_compact_values_are_shared(self):
+        file = self.write(self.streams())
+        with contextlib.redirect_stdout(io.StringIO()), pdf.PdfInterpreter(file,fast=True,compact=True) as interp:
+            objects = interp.parseParallel(workers=4,minChunk=4096)
+        first,second = objects[(10,0)][0],objects[(408,0)][0]     # far apart, parsed by different workers
+        key, = first
+        self.assertIs(key,next(iter(second)))
+        self.assertIs(key,pdf.NAMES[b'Length'])
+        self.assertIs(first[b'Length'],pdf.REFS[(11,0)])
+        self.assertIs(objects[(3,0)][0][b'Parent'],objects[(1,0)][0][b'Pages'])
+
+
+class TestXref(PdfTestCase):
+
+    def body(self,objs):
+        # header and objects without an xref, {objNum: offset}
+        out = bytearray(b'%PDF-1.7\n')
+        offsets = {}
+        for n,body in objs.items():
+            offsets[n] = len(out)
+            out += b'%d 0 obj\n' % n + body + b'\nendobj\n'
+        return out,offsets
+
+    def objects(self,interp,nums=(5,6)):
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            values = {n:interp.get_object(n) for n in nums}
+        self.assertEqual(log.getvalue(),'')
+        self.assertFalse(interp.recovered)
+        return values
+
+    def compressed(self):
+        objs = {k:v for k,v in SIMPLE.items() if k not in (5,6)}
+        objs[4] = objStm({5:b'(five)',6:b'(six)'})
+        return objs
+
+    def test_xref_stream(self):
+        out,offsets = self.body(self.compressed())
+        rows = {n:(1,offsets[n],0) for n in offsets}
+        rows.update({5:(2,4,0),6:(2,4,1),7:(1,len(out),0)})
+        start = len(out)
+        out += xrefStream(7,rows,8) + b'startxref\n%d\n%%%%EOF\n' % start
+        interp = self.open(bytes(out))
+        self.assertEqual(self.objects(interp),{5:[b'five'],6:[b'six']})
+        self.assertEqual(interp.xrefCompressed,{5:(4,0),6:(4,1)})
+
+    def test_hybrid(self):
+        # classic table for the regular objects, the compressed ones only in the /XRefStm stream
+        out,offsets = self.body(self.compressed())
+        stm = len(out)
+        out += xrefStream(7,{5:(2,4,0),6:(2,4,1)},8)
+        start = len(out)
+        out += b'xref\n0 8\n0000000000 65535 f\r\n'
+        for n in range(1,8):
+            out += b'%010d 00000 n\r\n' % offsets[n] if n in offsets else b'0000000000 00000 f\r\n'
+        out += b'trailer\n<< /Size 8 /Root 1 0 R /XRefStm %d >>\nstartxref\n%d\n%%%%EOF\n' % (stm,start)
+        interp = self.open(bytes(out))
+        self.assertEqual(self.objects(interp,(1,5,6)),
+                         {1:[{b'Type':b'Catalog',b'Pages':{(2,0):'REF'}}],5:[b'five'],6:[b'six']})
+
+    def test_prev_chain(self):
+        # classic base, then an update that replaces 5 through a classic section and 6 through an xref stream
+        data = bytearray(buildPdf(SIMPLE))
+        first = int(data[data.rindex(b'startxref')+10:].split()[0])
+        five = len(data)
+        data += b'5 0 obj\n(five v2)\nendobj\n'
+        second = len(data)
+        data += b'xref\n5 1\n%010d 00000 n\r\ntrailer\n<< /Size 7 /Root 1 0 R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n' % (
+            five,first,second)
+        six = len(data)
+        data += b'6 0 obj\n(six v2)\nendobj\n'
+        start = len(data)
+        data += xrefStream(7,{6:(1,six,0),7:(1,start,0)},8,b'/Prev %d ' % second)
+        data += b'startxref\n%d\n%%%%EOF\n' % start
+        interp = self.open(bytes(data))
+        self.assertEqual(self.objects(interp,(1,3,5,6)),{1:[{b'Type':b'Catalog',b'Pages':{(2,0):'REF'}}],
+                         3:[{b'Type':b'Page',b'Parent':{(2,0):'REF'}}],5:[b'five v2'],6:[b'six v2']})
+
+    def test_bad_object_stream(self):
+        # /N larger than the header, and no /First: reported, the object is missing, nothing raises
+        for stm in (objStm({5:b'(five)',6:b'(six)'}).replace(b'/N 2',b'/N 9'),
+                    objStm({5:b'(five)',6:b'(six)'}).replace(b'/First',b'/Foo')):
+            objs = self.compressed()
+            objs[4] = stm
+            out,offsets = self.body(objs)
+            rows = {n:(1,offsets[n],0) for n in offsets}
+            rows.update({5:(2,4,0),6:(2,4,1),7:(1,len(out),0)})
+            start = len(out)
+            out += xrefStream(7,rows,8) + b'startxref\n%d\n%%%%EOF\n' % start
+            interp = self.open(bytes(out))
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):
+                self.assertIsNone(interp.get_object(5))
+                interp.seek(0)
+                found = [n for n,_,_,_ in interp.iter_objects()]
+            self.assertEqual(found,[1,2,3,4,7])
+            self.assertIn('object stream 4',log.getvalue())
+
+
+class TestPages(PdfTestCase):
+
+    TREE = {
+        1:b'<< /Type /Catalog /Pages 2 0 R >>',
+        2:b'<< /Type /Pages /Kids [3 0 R 4 0 R 7 0 R] /Count 4 /Resources << /Font << /F1 9 0 R >> >> /Rotate 90 >>',
+        3:b'<< /Type /Page /Parent 2 0 R /Rotate 0 >>',
+        4:b'<< /Type /Pages /Parent 2 0 R /Kids [5 0 R 6 0 R] /Count 2 /MediaBox [0 0 100 100] >>',
+        5:b'<< /Type /Page /Parent 4 0 R /N 5 >>',
+        6:b'<< /Type /Page /Parent 4 0 R /N 6 /MediaBox [0 0 50 50] >>',
+        7:b'<< /Type /Page /Parent 2 0 R /N 7 >>',
+        9:b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    }
+
+    def test_get_page(self):
+        interp = self.open(self.TREE)
+        self.assertEqual(interp.page_count(),4)
+        self.assertEqual([interp.get_page(i).get(b'N') for i in (1,2,3,-1,-3)],[5,6,7,7,5])
+        self.assertIs(interp.get_page(0)[b'Parent'].value,interp.pagesRoot())
+        with self.assertRaises(IndexError):
+            interp.get_page(4)
+        with self.assertRaises(IndexError):
+            interp.get_page(-5)
+
+    def test_missing_count(self):
+        objs = dict(self.TREE)
+        objs[2] = objs[2].replace(b'/Count 4 ',b'')
+        objs[4] = objs[4].replace(b'/Count 2 ',b'')
+        interp = self.open(objs)
+        self.assertEqual(interp.page_count(),4)
+        self.assertEqual(interp.get_page(-2).get(b'N'),6)
+        self.assertEqual(len(list(interp.iterPages())),4)
+
+    def test_dangling_kids(self):
+        objs = dict(self.TREE)
+        objs[2] = b'<< /Type /Pages /Kids 99 0 R >>'
+        interp = self.open(objs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(interp.page_count(),0)
+            self.assertEqual(list(interp.iterPages()),[])
+            with self.assertRaises(IndexError):
+                interp.get_page(0)
+
+    def test_inherited_attributes(self):
+        interp = self.open(self.TREE)
+        pages = [interp.get_page(i) for i in range(4)]
+        self.assertEqual([interp.pageAttribute(p,b'Rotate') for p in pages],[0,90,90,90])
+        self.assertEqual([interp.pageAttribute(p,b'MediaBox') for p in pages],[None,[0,0,100,100],[0,0,50,50],None])
+        font = interp.pageAttribute(pages[2],b'Resources')[b'Font'][b'F1']
+        self.assertEqual(font[b'BaseFont'],b'Helvetica')
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def tokens(self,data,fast):
+        # (type, data, pos) of every token, None where the tokenizer reported an error and went on
+        interp = pdf.PdfInterpreter(None,fast=fast,data=data)
+        out = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not interp.EOF:
+                token = interp.nextToken()
+                if token or not interp.EOF:
+                    out.append((token.type,token.data,token.pos) if token else None)
+        return out
+
+    def test_same_tokens_as_legacy(self):
+        # bulk scanner against the byte at a time tokenizer, every benchmark profile and line ending
+        for profile,build in benchmark_pdf.PROFILES.items():
+            for eol in (b'\n',b'\r\n',b'\r'):
+                with self.subTest(profile=profile,eol=eol):
+                    data = benchmark_pdf.buildPdf(build(4096,eol),eol)
+                    legacy = self.tokens(data,False)
+                    self.assertGreater(len(legacy),50)
+                    self.assertEqual(self.tokens(data,True),legacy)
+
+    def test_same_objects_as_legacy(self):
+        # iter_objects reads the common tokens inline, without the scanner: same objects as the legacy tokenizer
+        for profile,build in benchmark_pdf.PROFILES.items():
+            for eol in (b'\n',b'\r\n',b'\r'):
+                with self.subTest(profile=profile,eol=eol):
+                    data = benchmark_pdf.buildPdf(build(4096,eol),eol)
+                    objects = [list(pdf.PdfInterpreter(None,fast=fast,data=data).iter_objects()) for fast in (True,False)]
+                    self.assertGreater(len(objects[1]),2)
+                    self.assertEqual(objects[0],objects[1])
+
+    def test_malformed_numbers(self):
+        data = b'- --5 1.2.3 4. +7 '
+        tokens = self.tokens(data,True)
+        self.assertEqual(tokens,self.tokens(data,False))
+        self.assertEqual([t[1] for t in tokens],[0,0,0,4,7])
+
+    def test_seek_between_tokens(self):
+        # the scanner restarts wherever seek puts it, also in the middle of its finditer pass
+        interp = pdf.PdfInterpreter(None,fast=True,data=b'1 2 /A (s) 3 [4]')
+        self.assertEqual(interp.nextToken().data,1)
+        interp.seek(11)
+        self.assertEqual(interp.nextToken().data,3)
+        interp.seek(2)
+        self.assertEqual([interp.nextToken().data for _ in range(3)],[2,b'A',b's'])
+        self.assertEqual(interp.nextToken().data,3)
+
+    def test_token_buffer(self):
+        data = b'1 0 obj << /A [1 2 3] >> endobj'
+        interp = pdf.PdfInterpreter(None,fast=True,data=data,tokenBuffer=True)
+        interp.tokenize()
+        kept = list(interp.tokens)
+        self.assertEqual(len(kept),12)
+        self.assertEqual(kept[:3],[(pdf.NUM_INT,0,1),(pdf.NUM_INT,2,1),(pdf.OBJ_BEGIN,4,3)])
+        self.assertEqual(kept[-1],(pdf.OBJ_END,25,6))
+        ring = pdf.PdfInterpreter(None,fast=True,data=data,tokenBuffer=True,keepTokens=5)
+        ring.tokenize()
+        tokens = ring.tokens
+        self.assertEqual((tokens.count,len(tokens)),(12,5))       # wrapped around twice
+        self.assertEqual(list(tokens),kept[-5:])
+        self.assertEqual([tokens[i] for i in range(-5,0)],kept[-5:])
+        self.assertEqual(tokens[-1],kept[-1])
+        self.assertEqual(tokens[0],kept[7])
+        for i in (5,-6):
+            with self.assertRaises(IndexError):
+                tokens[i]
+
+    def test_stats_and_progress(self):
+        data = benchmark_pdf.buildPdf(benchmark_pdf.PROFILES['objects'](20000,b'\n'))
+        for fast in (True,False):
+            with self.subTest(fast=fast):
+                counts = [0]*len(pdf.TOKEN_NAMES)
+                for token in self.tokens(data,fast):
+                    if token:
+                        counts[token[0]] += 1
+                calls = []
+                interp = pdf.PdfInterpreter(None,fast=fast,data=data,stats=True,progressEvery=4096,
+                                            progress=lambda *args: calls.append(args))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    interp.tokenize()
+                self.assertEqual(interp.stats.tokens,counts)
+                report = interp.stats.report()
+                self.assertEqual(report['tokens'],{pdf.TOKEN_NAMES[t]:n for t,n in enumerate(counts) if n})
+                self.assertGreater(report['tokenizer_s'],0)
+                self.assertGreaterEqual(len(calls),len(data)//4096)
+                self.assertEqual([position for position,_,_ in calls],sorted(position for position,_,_ in calls))
+                self.assertEqual(calls[-1][:2],(len(data),len(data)))     # once more at EOF
+
+
+if __name__ == '__main__':
+    unittest.main()